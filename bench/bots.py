@@ -0,0 +1,100 @@
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import contextlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "poker_server"))
+
+import sim
+import bots
+import equity
+import commands
+from engine import Poker
+from seatfill import SeatFiller
+from reconnect import Stalls
+
+class TimedFiller(SeatFiller):
+
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		self.latencies = []
+		self.timeouts = 0
+
+	async def act(self, poker, bot, seat, turn_no):
+		start = time.perf_counter()
+		await super().act(poker, bot, seat, turn_no)
+		elapsed = time.perf_counter() - start
+		self.latencies.append(elapsed)
+		self.timeouts += elapsed >= self.budget
+
+def decide_cost(budget, runs, players):
+	# decide() inline, as a worker runs it, over random spots on each street
+	rng = random.Random(0)
+	start = time.perf_counter()
+	for _ in range(runs):
+		cards = rng.sample(range(52), 7)
+		board = cards[2:2 + rng.choice((0, 3, 4, 5))]
+		bots.decide(cards[:2], board, players - 1, 100, 300, 200, 10000, 100, budget = budget * 0.8, seed = rng.getrandbits(63))
+	return (time.perf_counter() - start) / runs
+
+def percentile(values, q):
+	values = sorted(values)
+	return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+async def load(loop, tables, players, budget, workers, seconds):
+	# bots-only tables, every seat house-filled, playing back to back
+	filler = TimedFiller(fill = players, budget = budget, workers = workers, min_humans = 0, seed = 0)
+	await asyncio.wrap_future(filler.get_executor().submit(int))
+	server = sim.HeadlessServer()
+	running = []
+	pokers = []
+	for t in range(tables):
+		table = Poker(loop, f"b{t}", sio = server, seed = t, bots = filler, play_money = True)
+		pokers.append(table)
+		running.append(loop.create_task(table.main()))
+		table.submit(commands.Start())
+	with Stalls(loop) as stalls:
+		await asyncio.sleep(seconds)
+	for task in running + [task for table in pokers for task in table.background]:
+		task.cancel()
+	filler.executor.shutdown(cancel_futures=True)
+	return len(filler.latencies) / seconds, filler, stalls.worst
+
+async def run(args):
+	loop = asyncio.get_event_loop()
+	failed = False
+	print(f"decide() cost, {args.players} handed: " + "  ".join(f"{budget * 1000:g}ms budget {decide_cost(budget, 200, args.players) * 1000:.2f}ms" for budget in args.budgets))
+	for budget in args.budgets:
+		print(f"\nbudget {budget * 1000:g} ms, {args.workers} worker(s), {args.players} bots a table")
+		best = 0.0
+		for tables in args.tables:
+			with contextlib.redirect_stdout(open(os.devnull, "w")):
+				rate, filler, stall = await load(loop, tables, args.players, budget, args.workers, args.seconds)
+			timed_out = filler.timeouts / max(len(filler.latencies), 1)
+			print(f"{tables:4d} tables {rate:8.0f} decisions/sec  p50 {percentile(filler.latencies, 0.5) * 1000:6.1f} ms"
+				f"  p99 {percentile(filler.latencies, 0.99) * 1000:6.1f} ms  over budget {timed_out:6.1%}  loop stall {stall * 1000:5.1f} ms")
+			if timed_out <= args.miss:
+				best = max(best, rate)
+		# a seated bot is asked for a move about once every turn_every seconds
+		per_core = best / args.workers * args.turn_every
+		print(f"bots per core at {budget * 1000:g} ms with at most {args.miss:.0%} over budget: {per_core:.0f}")
+		failed |= best == 0
+	equity.get_executor().shutdown(cancel_futures=True)
+	return 1 if failed else 0
+
+def main():
+	parser = argparse.ArgumentParser(description="Measure house bot decisions per second and bots per core within a decision budget")
+	parser.add_argument("--budgets", type=float, nargs="+", default=[0.01, 0.05])
+	parser.add_argument("--tables", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+	parser.add_argument("--players", type=int, default=6)
+	parser.add_argument("--workers", type=int, default=os.cpu_count())
+	parser.add_argument("--seconds", type=float, default=3)
+	parser.add_argument("--miss", type=float, default=0.01)
+	parser.add_argument("--turn-every", type=float, default=15)
+	sys.exit(asyncio.get_event_loop().run_until_complete(run(parser.parse_args())))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,92 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import contextlib
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "poker_server"))
+
+import sim
+import equity
+
+THRESHOLDS = os.path.join(os.path.dirname(__file__), "thresholds.json")
+
+def percentile(values, p):
+	values = sorted(values)
+	return values[min(int(len(values) * p), len(values) - 1)] if values else 0.0
+
+async def measure(players, hands, seed):
+	harness = sim.random_table(players, seed)
+	start = time.perf_counter()
+	played = await harness.run(hands)
+	elapsed = time.perf_counter() - start
+	latencies = harness.latencies
+	return {
+		"hands_per_sec": played / elapsed,
+		"p50_ms": percentile(latencies, 0.5) * 1000,
+		"p95_ms": percentile(latencies, 0.95) * 1000,
+		"p99_ms": percentile(latencies, 0.99) * 1000,
+		"emits_per_hand": harness.server.emits / max(played, 1),
+	}
+
+async def allocations(players, hands, seed):
+	# Separate pass: tracing slows everything down, so it is not timed.
+	harness = sim.random_table(players, seed)
+	tracemalloc.start()
+	blocks = sys.getallocatedblocks()
+	played = await harness.run(hands)
+	retained = sys.getallocatedblocks() - blocks
+	peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	return {"peak_kib_per_hand": peak / 1024 / max(played, 1), "blocks_per_hand": retained / max(played, 1)}
+
+def check(results, thresholds):
+	failures = []
+	for players, result in results.items():
+		limits = thresholds.get(str(players), {})
+		if result["hands_per_sec"] < limits.get("min_hands_per_sec", 0):
+			failures.append(f"{players} players: {result['hands_per_sec']:.1f} hands/sec < {limits['min_hands_per_sec']}")
+		if result["p99_ms"] > limits.get("max_p99_ms", float("inf")):
+			failures.append(f"{players} players: p99 {result['p99_ms']:.2f}ms > {limits['max_p99_ms']}ms")
+		if result["blocks_per_hand"] > limits.get("max_blocks_per_hand", float("inf")):
+			failures.append(f"{players} players: {result['blocks_per_hand']:.1f} retained blocks/hand > {limits['max_blocks_per_hand']}")
+	return failures
+
+async def run(args):
+	results = {}
+	for players in range(args.min_players, args.max_players + 1):
+		with contextlib.redirect_stdout(open(os.devnull, "w")):
+			result = await measure(players, args.hands, args.seed)
+			result.update(await allocations(players, args.alloc_hands, args.seed))
+		results[players] = result
+		print(f"{players} players  hands/sec: {result['hands_per_sec']:8.1f}  action ms p50: {result['p50_ms']:.3f}  p95: {result['p95_ms']:.3f}  p99: {result['p99_ms']:.3f}"
+			f"  emits/hand: {result['emits_per_hand']:.1f}  peak KiB/hand: {result['peak_kib_per_hand']:.1f}  retained blocks/hand: {result['blocks_per_hand']:.1f}")
+	equity.get_executor().shutdown(cancel_futures=True)
+	if args.json:
+		with open(args.json, "w") as f:
+			json.dump(results, f, indent=2)
+	if args.check:
+		with open(args.thresholds) as f:
+			failures = check(results, json.load(f))
+		for failure in failures:
+			print("REGRESSION", failure)
+		return 1 if failures else 0
+	return 0
+
+def main():
+	parser = argparse.ArgumentParser(description="Play seeded bot hands against a headless table and report engine throughput")
+	parser.add_argument("--hands", type=int, default=500)
+	parser.add_argument("--alloc-hands", type=int, default=50)
+	parser.add_argument("--min-players", type=int, default=2)
+	parser.add_argument("--max-players", type=int, default=9)
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--json", help="write raw results here")
+	parser.add_argument("--check", action="store_true", help="exit nonzero if any result is past its threshold")
+	parser.add_argument("--thresholds", default=THRESHOLDS)
+	sys.exit(asyncio.get_event_loop().run_until_complete(run(parser.parse_args())))
+
+if __name__ == "__main__":
+	main()
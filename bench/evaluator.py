@@ -0,0 +1,81 @@
+import os
+import sys
+import time
+import random
+import argparse
+import itertools
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "poker_server"))
+
+import evaluator
+from evaluator import evaluate, encode_hand, evaluate_hand, parse_cards, CARD_NAMES
+
+def legacy(cards):
+	return max([evaluate_hand(x) for x in itertools.combinations(parse_cards(cards), 5)], key = encode_hand)
+
+def normalize(hand):
+	# The legacy evaluator drops the quads kicker and orders trips kickers by
+	# set iteration order, so only the made rank is comparable for those.
+	name, kickers = hand
+	if name in ('Four of a kind', 'Three of a kind'):
+		return (name, kickers[:1])
+	return (name, list(kickers))
+
+def stratified(rng, per_category):
+	# Rare categories are seeded with a made hand and topped up to seven cards.
+	seeds = {
+		'Straight flush': lambda: [CARD_NAMES[(r + i) * 4 + s] for s in [rng.randrange(4)] for r in [rng.randrange(8)] for i in range(5)],
+		'Four of a kind': lambda: [CARD_NAMES[r * 4 + s] for r in [rng.randrange(13)] for s in range(4)],
+		'Full house': lambda: [CARD_NAMES[c] for r, p in [rng.sample(range(13), 2)] for c in rng.sample(range(r * 4, r * 4 + 4), 3) + rng.sample(range(p * 4, p * 4 + 4), 2)],
+		'Flush': lambda: [CARD_NAMES[r * 4 + s] for s in [rng.randrange(4)] for r in rng.sample(range(13), 5)],
+	}
+	for _ in range(per_category):
+		yield rng.sample(CARD_NAMES, 7)
+		for seed in seeds.values():
+			cards = seed()
+			cards += rng.sample([c for c in CARD_NAMES if c not in cards], 7 - len(cards))
+			yield cards
+
+def check(hands):
+	counts = {}
+	for cards in hands:
+		new = evaluator.describe(evaluate([evaluator.CARD_INDEX[c] for c in cards]))
+		old = legacy(cards)
+		if normalize(new) != normalize(old):
+			raise AssertionError(f"{cards}: lookup {new} != legacy {old}")
+		counts[new[0]] = counts.get(new[0], 0) + 1
+	return counts
+
+def main():
+	parser = argparse.ArgumentParser(description="Check and time the 7-card lookup evaluator against the legacy 21-combination path")
+	parser.add_argument("--samples", type=int, default=20000)
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--exhaustive5", action="store_true", help="also check every 5-card hand")
+	args = parser.parse_args()
+	rng = random.Random(args.seed)
+
+	counts = check(stratified(rng, args.samples // 5))
+	print("checked", sum(counts.values()), "7-card hands:", counts)
+	if args.exhaustive5:
+		total = 0
+		for cards in itertools.combinations(CARD_NAMES, 5):
+			new = evaluator.describe(evaluator.evaluate_strs(cards))
+			if normalize(new) != normalize(evaluate_hand(parse_cards(cards))):
+				raise AssertionError(f"{cards}: {new}")
+			total += 1
+		print("checked", total, "5-card hands")
+
+	hands = [rng.sample(CARD_NAMES, 7) for _ in range(args.samples)]
+	indices = [[evaluator.CARD_INDEX[c] for c in cards] for cards in hands]
+	start = time.perf_counter()
+	for cards in hands[:2000]:
+		legacy(cards)
+	legacy_rate = 2000 / (time.perf_counter() - start)
+	start = time.perf_counter()
+	for cards in indices:
+		evaluate(cards)
+	lookup_rate = len(indices) / (time.perf_counter() - start)
+	print(f"legacy: {legacy_rate:,.0f} hands/s  lookup: {lookup_rate:,.0f} hands/s  ({lookup_rate / legacy_rate:.0f}x)")
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,52 @@
+import io
+import os
+import sys
+import time
+import asyncio
+import sqlite3
+import argparse
+import tempfile
+import contextlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "poker_server"))
+
+import database
+
+async def player(name, rounds, amount):
+	for _ in range(rounds):
+		if await database.join(name, amount) == "success":
+			await database.leave(name, amount)
+
+async def run(args):
+	start = time.perf_counter()
+	await asyncio.gather(*[player(f"user{i % args.users}", args.rounds, args.amount) for i in range(args.sockets)])
+	elapsed = time.perf_counter() - start
+	ops = args.sockets * args.rounds * 2
+	print(f"{args.sockets} sockets over {args.users} accounts: {ops} ops in {elapsed:.2f}s ({ops / elapsed:,.0f} ops/s)")
+
+	# Everyone tries to buy in for the whole stack at once; exactly one may win.
+	with contextlib.redirect_stdout(io.StringIO()):
+		results = await asyncio.gather(*[database.join("contested", database.STARTING_CHIPS) for _ in range(args.sockets)])
+	assert results.count("success") == 1, results.count("success")
+	balances = [await database.get_chips(f"user{i}") for i in range(args.users)]
+	assert all(qty == database.STARTING_CHIPS for qty in balances), balances
+	print("no double spends, balances conserved")
+
+def main():
+	parser = argparse.ArgumentParser(description="Concurrent buy-in/cash-out throughput against the chip ledger")
+	parser.add_argument("--sockets", type=int, default=200)
+	parser.add_argument("--users", type=int, default=50)
+	parser.add_argument("--rounds", type=int, default=20)
+	parser.add_argument("--amount", type=int, default=500)
+	args = parser.parse_args()
+	with tempfile.TemporaryDirectory() as tmp:
+		path = os.path.join(tmp, "poker.db")
+		con = sqlite3.connect(path)
+		con.execute("CREATE TABLE chips (username text, qty real, last_replenished text)")
+		con.close()
+		database.ledger = database.Ledger(path)
+		asyncio.get_event_loop().run_until_complete(run(args))
+		database.close_connection()
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,114 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "poker_server"))
+
+import sim
+import equity
+from state import Seat
+from engine import Poker
+from lobby import Lobby, ROOM
+
+async def run(args):
+	loop = asyncio.get_event_loop()
+	rng = random.Random(0)
+	server = sim.HeadlessServer()
+	server.rooms[ROOM] = {f"viewer-{i}" for i in range(args.viewers)}
+	index = Lobby(server, interval = args.interval)
+	start = time.perf_counter()
+	tables = [Poker(loop, f"t{t}", sio = server, lobby = index) for t in range(args.tables)]
+	created = time.perf_counter() - start
+	for table in tables:
+		for seat in rng.sample(range(9), rng.randrange(10)):
+			table.sit(f"{table.table_id}-{seat}", seat, 10000)
+		table.hand_running = True
+		index.update(table)
+	await index.flush()
+
+	# each table ends a hand every hand_gap seconds give or take a third, and
+	# someone sits down or stands up about every seat_gap seconds
+	now = 0.0
+	next_hand = [rng.uniform(0, args.hand_gap) for _ in tables]
+	events = 0
+	busy = 0.0
+	flushing = 0.0
+	pushed_rows = 0
+	pushed_bytes = 0
+	pushes = 0
+	for tick in range(int((args.warmup + args.seconds) / args.interval)):
+		now += args.interval
+		if tick == int(args.warmup / args.interval):
+			# counted from here, once every table has a few hands behind its averages
+			events = pushes = pushed_rows = pushed_bytes = server.emits = server.deliveries = 0
+			busy = flushing = 0.0
+		start = time.perf_counter()
+		for i, table in enumerate(tables):
+			while next_hand[i] <= now:
+				index.hand_ended(table, rng.randrange(table.big_blind, table.big_blind * 40), now = next_hand[i])
+				next_hand[i] += args.hand_gap * rng.uniform(0.67, 1.33)
+				events += 1
+		for table in rng.sample(tables, int(len(tables) * args.interval / args.seat_gap)):
+			seats = table.table.seats
+			seat = rng.randrange(9)
+			seats[seat] = None if seats[seat] else Seat(f"{table.table_id}-{seat}", 10000)
+			index.update(table)
+			events += 1
+		busy += time.perf_counter() - start
+		start = time.perf_counter()
+		message = index.changes()
+		if message is not None:
+			await server.emit('lobby', message, to=ROOM)
+			pushes += 1
+			pushed_rows += len(message["rows"]) + len(message["removed"])
+			pushed_bytes += len(json.dumps(message))
+		flushing += time.perf_counter() - start
+
+	start = time.perf_counter()
+	body, etag = index.listing()
+	encode = time.perf_counter() - start
+	start = time.perf_counter()
+	for _ in range(args.requests):
+		index.listing()
+	cached = (time.perf_counter() - start) / args.requests
+
+	# what a viewer took before: every table's state broadcast, sized from a
+	# table with a hand in flight and moves_per_hand broadcasts a hand
+	sample = Poker(loop, "sample", sio = server)
+	for seat in range(6):
+		sample.sit(f"player-{seat}", seat, 10000)
+	sample.new_hand()
+	state_bytes = len(json.dumps(sample.table.public_wire()))
+	before = args.tables / args.hand_gap * args.moves_per_hand * state_bytes
+
+	seconds = args.seconds
+	print(f"{args.tables} tables, {args.viewers} lobby viewers, {seconds:g}s simulated after {args.warmup:g}s warmup, a hand every {args.hand_gap:g}s a table")
+	print(f"table events      {events / seconds:10.0f}/sec   {busy / events * 1e6:6.2f} us each on the loop ({busy / seconds * 100:.2f}% of a core)")
+	print(f"pushes            {pushes / seconds:10.2f}/sec   {pushed_rows / max(pushes, 1):8.0f} rows, {pushed_bytes / max(pushes, 1) / 1024:7.1f} KiB each, {flushing / max(pushes, 1) * 1000:.2f} ms to build")
+	print(f"rows changed      {pushed_rows / max(events, 1):10.1%} of table events")
+	print(f"per viewer        {pushed_bytes / seconds / 1024:10.1f} KiB/sec pushed, against ~{before / 1024:.0f} KiB/sec following every table's state")
+	print(f"socket.io sends   {server.deliveries / seconds:10.0f}/sec from {server.emits / seconds:.2f} room emits/sec")
+	print(f"listing           {len(body) / 1024:10.1f} KiB   encoded in {encode * 1000:.1f} ms, {cached * 1e9:.0f} ns when cached   ETag {etag}")
+	print(f"{args.tables} tables created with their rows in {created * 1000:.0f} ms")
+	equity.get_executor().shutdown(cancel_futures=True)
+	return 0
+
+def main():
+	parser = argparse.ArgumentParser(description="Cost of keeping the lobby index and pushing changed rows with many tables and lobby viewers")
+	parser.add_argument("--tables", type=int, default=10000)
+	parser.add_argument("--viewers", type=int, default=50000)
+	parser.add_argument("--seconds", type=float, default=120)
+	parser.add_argument("--warmup", type=float, default=600)
+	parser.add_argument("--interval", type=float, default=1)
+	parser.add_argument("--hand-gap", type=float, default=60)
+	parser.add_argument("--seat-gap", type=float, default=300)
+	parser.add_argument("--moves-per-hand", type=float, default=12)
+	parser.add_argument("--requests", type=int, default=100000)
+	sys.exit(asyncio.get_event_loop().run_until_complete(run(parser.parse_args())))
+
+if __name__ == "__main__":
+	main()
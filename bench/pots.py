@@ -0,0 +1,104 @@
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import contextlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "poker_server"))
+
+import sim
+import pots
+import equity
+import history
+
+def reference(contributed, live, ranks, order):
+	"""Brute force: every chip level is its own pot among the live seats that
+	covered it, levels with the same seats are then merged and split."""
+	layers = {}
+	eligible = tuple(seat for seat in order if seat in live)
+	for level in range(1, max(contributed.values(), default = 0) + 1):
+		covered = tuple(seat for seat in order if seat in live and contributed[seat] >= level)
+		eligible = covered or eligible
+		layers[eligible] = layers.get(eligible, 0) + sum(1 for chips in contributed.values() if chips >= level)
+	won = {}
+	for eligible, amount in layers.items():
+		best = max(ranks[seat] for seat in eligible)
+		winners = [seat for seat in eligible if ranks[seat] == best]
+		for i, seat in enumerate(winners):
+			won[seat] = won.get(seat, 0) + amount // len(winners) + (1 if i < amount % len(winners) else 0)
+	return won
+
+def random_case(rng):
+	players = rng.randint(2, 9)
+	order = rng.sample(range(9), players)
+	# few distinct stacks and ranks so ties and equal all-ins are common
+	stacks = [rng.choice((1, 2, 3, 5, 8, 13, 40, 100)) for _ in order]
+	contributed = {seat: rng.randint(0, stack) if rng.random() < 0.3 else stack for seat, stack in zip(order, stacks)}
+	live = [seat for seat in order if rng.random() < 0.8] or [order[0]]
+	ranks = {seat: rng.randint(1, 4) for seat in order}
+	return contributed, live, ranks, order
+
+def property_check(cases, seed):
+	rng = random.Random(seed)
+	failures = 0
+	for case in range(cases):
+		contributed, live, ranks, order = random_case(rng)
+		won = {seat: chips for seat, chips in pots.settle(contributed, live, ranks, order).items() if chips}
+		expected = {seat: chips for seat, chips in reference(contributed, live, ranks, order).items() if chips}
+		if won != expected or sum(won.values()) != sum(contributed.values()):
+			failures += 1
+			if failures <= 5:
+				print(f"MISMATCH case {case}: contributed={contributed} live={live} ranks={ranks} order={order} got={won} expected={expected}")
+	return failures
+
+def timing(runs, seed):
+	rng = random.Random(seed)
+	order = list(range(9))
+	cases = []
+	for _ in range(1000):
+		contributed = {seat: rng.randint(1, 10 ** 6) for seat in order}
+		cases.append((contributed, order, {seat: rng.randint(1, 7462) for seat in order}, order))
+	start = time.perf_counter()
+	for i in range(runs):
+		pots.settle(*cases[i % len(cases)])
+	return (time.perf_counter() - start) / runs * 1e6
+
+async def short_stacks(players, hands, seed):
+	# Real hands with stacks of a few big blinds, so most go all in. Every
+	# logged hand must replay to the same stacks, conserve chips and leave no
+	# stack negative.
+	log = []
+	harness = sim.random_table(players, seed, stack = 400, history = log)
+	with contextlib.redirect_stdout(open(os.devnull, "w")):
+		await harness.run(hands, timeout = 30)
+	bad = 0
+	for record in log:
+		stacks, ok = await history.replay(record)
+		start = sum(stack for seat, name, stack in record.seats)
+		end = sum(stack for seat, stack, rank in record.result)
+		if not ok or start != end or min(stacks.values()) < 0:
+			bad += 1
+	return len(log), bad, harness.server.errors
+
+def main():
+	parser = argparse.ArgumentParser(description="Check side pot settlement against a brute-force reference and time it")
+	parser.add_argument("--cases", type=int, default=100000)
+	parser.add_argument("--runs", type=int, default=100000)
+	parser.add_argument("--hands", type=int, default=300)
+	parser.add_argument("--seed", type=int, default=0)
+	args = parser.parse_args()
+	failures = property_check(args.cases, args.seed)
+	print(f"{args.cases} random 2-9 player pots: {failures} mismatches")
+	print(f"9-way showdown settle: {timing(args.runs, args.seed):.1f} us")
+	loop = asyncio.get_event_loop()
+	for players in (2, 3, 6, 9):
+		played, bad, errors = loop.run_until_complete(short_stacks(players, args.hands, args.seed))
+		print(f"{players} short stacks: {played} hands logged, {bad} bad replays, {len(errors)} errors")
+		failures += bad
+	equity.get_executor().shutdown(cancel_futures=True)
+	sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+	main()
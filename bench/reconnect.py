@@ -0,0 +1,114 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import contextlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "poker_server"))
+
+import jwt
+import sim
+import auth
+import equity
+import commands
+from engine import Poker
+
+SECRET = "bench-secret"
+
+class Stalls():
+	"""Longest the loop went without running a 1ms ticker."""
+
+	def __init__(self, loop):
+		self.loop = loop
+		self.worst = 0.0
+		self.last = None
+		self.task = None
+
+	async def tick(self):
+		while True:
+			await asyncio.sleep(0.001)
+			self.lap()
+
+	def lap(self):
+		now = self.loop.time()
+		self.worst = max(self.worst, now - self.last - 0.001)
+		self.last = now
+
+	def __enter__(self):
+		self.last = self.loop.time()
+		self.task = self.loop.create_task(self.tick())
+		return self
+
+	def __exit__(self, *exc):
+		self.lap()
+		self.task.cancel()
+
+async def connect_before(table, sid, environ):
+	# on_connect and watch as they were: decode on the loop, then a
+	# broadcast from the socket handler for every arrival
+	username = jwt.decode(auth.cookie_token(environ), SECRET)["user_id"]
+	table.add_user(sid, username)
+	await table.notify_state()
+
+async def connect(table, sid, environ, tokens):
+	username = await tokens.verify(auth.cookie_token(environ))
+	table.add_user(sid, username)
+	table.submit(commands.Resync(sid, username))
+
+def seated(clients):
+	return all(username in table.views or username in table.spectators for table, sid, username, environ in clients)
+
+async def storm(loop, server, clients, connect, *args):
+	for table, sid, username, environ in clients:
+		table.remove_user(sid, username)
+	start = time.perf_counter()
+	with Stalls(loop) as stalls:
+		await asyncio.gather(*(connect(table, sid, environ, *args) for table, sid, username, environ in clients))
+		while not seated(clients):
+			server.changed.clear()
+			await server.changed.wait()
+	return time.perf_counter() - start, stalls.worst
+
+def build(loop, server, tables, per_table):
+	clients = []
+	expires = int(time.time()) + 3600
+	for t in range(tables):
+		table = Poker(loop, f"t{t}", sio = server)
+		for i in range(per_table):
+			username = f"u{t}-{i}"
+			if i < 9:
+				table.sit(username, i, 10000)
+			token = jwt.encode({"user_id": username, "exp": expires}, SECRET).decode()
+			environ = {"HTTP_COOKIE": f"session=abc; access_token={token}"}
+			clients.append((table, f"sid-{username}", username, environ))
+			table.add_user(f"sid-{username}", username)
+	return clients
+
+async def run(args):
+	loop = asyncio.get_event_loop()
+	server = sim.HeadlessServer()
+	clients = build(loop, server, args.tables, args.per_table)
+	tasks = [loop.create_task(table.main()) for table in {client[0] for client in clients}]
+	tokens = auth.TokenCache(SECRET)
+	results = []
+	with contextlib.redirect_stdout(open(os.devnull, "w")):
+		results.append(("before", *await storm(loop, server, clients, connect_before)))
+		results.append(("cache, cold", *await storm(loop, server, clients, connect, tokens)))
+		results.append(("cache, warm", *await storm(loop, server, clients, connect, tokens)))
+	for task in tasks:
+		task.cancel()
+	print(f"{len(clients)} clients over {args.tables} tables reconnecting at once")
+	for name, elapsed, stall in results:
+		print(f"{name:16s} all re-seated in {elapsed * 1000:8.1f} ms  longest loop stall {stall * 1000:6.1f} ms")
+	equity.get_executor().shutdown(cancel_futures=True)
+	return 0
+
+def main():
+	parser = argparse.ArgumentParser(description="Time a reconnect storm: every socket reconnects and is re-seated at once")
+	parser.add_argument("--tables", type=int, default=200)
+	parser.add_argument("--per-table", type=int, default=25)
+	sys.exit(asyncio.get_event_loop().run_until_complete(run(parser.parse_args())))
+
+if __name__ == "__main__":
+	main()
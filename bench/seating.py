@@ -0,0 +1,214 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import itertools
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "poker_server"))
+
+import sim
+import state
+import equity
+import commands
+from commands import CommandError
+from state import SEATS, Seat
+from engine import Poker
+
+# Exhaustive checks of the seat ring against plain walks round the table, over
+# every occupancy bitmask, button and (for the turn order) last bettor.
+
+def walk(mask, seat):
+	return [(seat + step) % SEATS for step in range(1, SEATS + 1) if mask >> ((seat + step) % SEATS) & 1]
+
+def check_ring():
+	failures = []
+	for mask, button in itertools.product(range(1 << SEATS), range(SEATS)):
+		order = walk(mask, button)
+		if state.next_seat(mask, button) != (order[0] if order else -1):
+			failures.append(f"next_seat({mask:09b}, {button})")
+		if state.ring(mask, button) != order:
+			failures.append(f"ring({mask:09b}, {button})")
+	return failures
+
+def check_blinds(loop, short):
+	# Deal a hand for every occupancy with two or more players and every
+	# button: the button moves to the next occupied seat and the two seats
+	# after it post, or heads up the button posts the small blind. With
+	# short stacks every stack is below the big blind.
+	failures = []
+	for mask, button in itertools.product(range(1 << SEATS), range(SEATS)):
+		if state.COUNT[mask] < 2:
+			continue
+		poker = Poker(loop, "seating")
+		table = poker.table
+		for seat in walk(mask, 0):
+			table.seats[seat] = Seat(f"p{seat}", 1 + seat * 5 if short else 10000)
+		table.button = button
+		poker.new_hand()
+		expected_button = walk(mask, button)[0]
+		order = walk(mask, expected_button)
+		if len(order) == 2:
+			order.reverse()
+		sb, bb = order[0], order[1]
+		posted = [min(table.big_blind // 2, 1 + sb * 5 if short else 10000), min(table.big_blind, 1 + bb * 5 if short else 10000)]
+		rnd, hand = table.round, table.hand
+		problems = []
+		if table.button != expected_button:
+			problems.append(f"button {table.button} != {expected_button}")
+		if hand.starting_positions != order:
+			problems.append(f"order {hand.starting_positions} != {order}")
+		if [rnd.chips_out[sb], rnd.chips_out[bb]] != posted or rnd.last_action[sb] != "smallblind" or rnd.last_action[bb] != "bigblind":
+			problems.append(f"blinds {rnd.chips_out[sb]}/{rnd.chips_out[bb]} != {posted}")
+		if any(rnd.chips_out[seat] for seat in order[2:]):
+			problems.append("chips out from a seat that posted nothing")
+		all_in = state.to_mask(seat for seat in (sb, bb) if table.seats[seat].chips == 0)
+		if hand.all_in != all_in:
+			problems.append(f"all in {hand.all_in:09b} != {all_in:09b}")
+		able = [seat for seat in walk(mask, bb) if not all_in >> seat & 1]
+		owes = [seat for seat in able if rnd.chips_out[seat] < table.turn.bet_size]
+		if len(able) < 2 and not owes:
+			if not rnd.over:
+				problems.append("nobody can act but the round is not over")
+		elif rnd.over or table.turn.action_player != able[0]:
+			problems.append(f"first to act {table.turn.action_player} != {able[0]}")
+		if problems:
+			failures.append(f"mask {mask:09b} button {button}: " + ", ".join(problems))
+	return failures
+
+def check_turns():
+	# next_actor against walking seat by seat: skip seats that cannot bet,
+	# and the round is over on reaching or passing the last bettor.
+	failures = []
+	poker = Poker(asyncio.new_event_loop(), "seating")
+	table = poker.table
+	for able, seat, last in itertools.product(range(1 << SEATS), range(SEATS), range(SEATS)):
+		table.hand.dealt, table.hand.folded, table.hand.all_in = able, 0, 0
+		table.round.last_bet_player = last
+		expected = None
+		for step in range(1, SEATS + 1):
+			candidate = (seat + step) % SEATS
+			if candidate == last:
+				break
+			if able >> candidate & 1:
+				expected = candidate
+				break
+		if poker.next_actor(seat) != expected:
+			failures.append(f"next_actor able {able:09b} from {seat} last bettor {last}: {poker.next_actor(seat)} != {expected}")
+	return failures
+
+# Scripted betting rounds: (street, seat, action) with the street the move is
+# expected on. Seat 0 has the button, so with three or more players seat 1
+# posts the small blind and seat 2 the big blind; heads up seat 0 posts the
+# small blind.
+ROUNDS = {
+	"big blind option": (4, [("preflop", 3, "call"), ("preflop", 0, "call"), ("preflop", 1, "call"), ("preflop", 2, "check"),
+		("flop", 1, "check"), ("flop", 2, "check"), ("flop", 3, "check"), ("flop", 0, "check"), ("turn", 1, "check")]),
+	"big blind raises": (4, [("preflop", 3, "call"), ("preflop", 0, "call"), ("preflop", 1, "call"), ("preflop", 2, 400),
+		("preflop", 3, "call"), ("preflop", 0, "call"), ("preflop", 1, "call"), ("flop", 1, "check")]),
+	"fold to two": (3, [("preflop", 0, "fold"), ("preflop", 1, "call"), ("preflop", 2, "check"),
+		("flop", 1, "check"), ("flop", 2, "check"), ("turn", 1, "check"), ("turn", 2, 200), ("turn", 1, "call"), ("river", 1, "check")]),
+	"heads up": (2, [("preflop", 0, "call"), ("preflop", 1, "check"), ("flop", 1, "check"), ("flop", 0, "check"),
+		("turn", 1, 200), ("turn", 0, "call"), ("river", 1, "check")]),
+}
+
+async def play_round(loop, players, moves):
+	poker = Poker(loop, "rounds", sio = sim.HeadlessServer())
+	for seat in range(players):
+		poker.table.seats[seat] = Seat(f"p{seat}", 10000)
+	poker.start_hand()
+	for street, seat, action in moves:
+		table = poker.table
+		if table.round.street != street or table.round.over or table.turn.action_player != seat:
+			return f"expected seat {seat} to act on the {street}, found seat {table.turn.action_player} on the {table.round.street}"
+		data = {"action": "raise", "amount": action} if isinstance(action, int) else {"action": action}
+		await poker.apply(commands.parse(None, f"p{seat}", data))
+		while not poker.queue.empty():
+			await poker.apply(poker.queue.get_nowait())
+	return None
+
+def check_rounds(loop):
+	failures = []
+	for name, (players, moves) in ROUNDS.items():
+		problem = loop.run_until_complete(play_round(loop, players, moves))
+		if problem:
+			failures.append(f"{name}: {problem}")
+	return failures
+
+async def vacated(loop):
+	# a player folds and stands up mid-hand; their seat still holds the
+	# hand's cards, so nobody sits there until it ends
+	poker = Poker(loop, "vacated", sio = sim.HeadlessServer(), play_money = True)
+	for seat in range(4):
+		poker.table.seats[seat] = Seat(f"p{seat}", 10000)
+	poker.start_hand()
+	seat = poker.table.turn.action_player
+	await poker.apply(commands.parse(None, f"p{seat}", {"action": "fold"}))
+	await poker.apply(commands.parse(None, f"p{seat}", {"action": "leave"}))
+	try:
+		await poker.apply(commands.parse(None, "newcomer", {"action": "join", "seat": seat, "amount": 5000}))
+	except CommandError:
+		return []
+	return [f"newcomer sat in seat {seat} mid-hand"]
+
+async def runout(loop):
+	# heads-up all in preflop: both hands face up with equity before the flop,
+	# then a street at a time
+	poker = Poker(loop, "runout", sio = sim.HeadlessServer(), play_money = True)
+	for seat in range(2):
+		poker.table.seats[seat] = Seat(f"p{seat}", 10000)
+	poker.add_user("sid-rail", "rail")
+	poker.start_hand()
+	problems = []
+	for action in ({"action": "raise", "amount": 10000}, {"action": "call"}):
+		seat = poker.table.turn.action_player
+		await poker.apply(commands.parse(None, f"p{seat}", action))
+	for street in ("preflop", "flop", "turn", "river"):
+		table = poker.table
+		if not poker.hand_running or table.round.street != street:
+			return problems + [f"runout went past the {street} without a pause"]
+		await asyncio.gather(*poker.background)
+		while not poker.queue.empty():
+			await poker.apply(poker.queue.get_nowait())
+		shown = table.private_wire(None, table.runout())
+		if len(shown["hole_cards"]) != 2 or len(shown["equity"]) != 2:
+			problems.append(f"{street}: spectators see {len(shown['hole_cards'])} hands and {len(shown['equity'])} equities")
+		poker.disarm_turn()
+		await poker.apply(commands.Advance(table.hand))
+	if poker.hand_running:
+		problems.append("hand still running after the river")
+	return problems
+
+def check_runout(loop):
+	return loop.run_until_complete(runout(loop))
+
+def check_vacated(loop):
+	return loop.run_until_complete(vacated(loop))
+
+def timing(runs):
+	poker = Poker(asyncio.new_event_loop(), "seating")
+	table = poker.table
+	table.hand.dealt = 0b111111111
+	table.round.last_bet_player = 4
+	start = time.perf_counter()
+	for i in range(runs):
+		poker.next_actor(i % SEATS)
+	return (time.perf_counter() - start) / runs * 1e9
+
+def main():
+	parser = argparse.ArgumentParser(description="Exhaustively check button movement, blinds and turn order over every seat occupancy")
+	parser.add_argument("--runs", type=int, default=1000000)
+	args = parser.parse_args()
+	loop = asyncio.get_event_loop()
+	failures = []
+	for name, found in (("ring", check_ring()), ("blinds", check_blinds(loop, False)), ("short blinds", check_blinds(loop, True)), ("turn order", check_turns()), ("rounds", check_rounds(loop)), ("vacated", check_vacated(loop)), ("runout", check_runout(loop))):
+		print(f"{name:12s} {len(found)} failures")
+		for failure in found[:5]:
+			print("  ", failure)
+		failures += found
+	print(f"next_actor: {timing(args.runs):.0f} ns")
+	equity.get_executor().shutdown(cancel_futures=True)
+	sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+	main()
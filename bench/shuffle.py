@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "poker_server"))
+
+import numpy as np
+import shuffle
+
+def per_hand(n):
+	# what new_hand did before: build the deck and Mersenne Twister shuffle it
+	rng = random.Random()
+	for _ in range(n):
+		deck = [card + suit for card in ["2", "3", "4", "5", "6", "7", "8", "9", "T", "J", "Q", "K", "A"] for suit in ["S", "H", "C", "D"]]
+		rng.shuffle(deck)
+
+def per_hand_csprng(n):
+	for _ in range(n):
+		shuffle.Shuffle(seed := os.urandom(32), shuffle.deal(seed)).cards()
+
+def batched(n, batch):
+	service = shuffle.ShuffleService(batch = batch, background = False)
+	for _ in range(n // batch):
+		service.fill()
+		while service.ready:
+			service.ready.popleft().cards()
+
+def drawn(n, batch):
+	# draw() as new_hand calls it, with the background thread refilling
+	service = shuffle.ShuffleService(batch = batch)
+	time.sleep(0.1)
+	for _ in range(n):
+		service.draw().cards()
+
+def rate(fn, n, *args):
+	start = time.perf_counter()
+	fn(n, *args)
+	return n / (time.perf_counter() - start)
+
+def uniformity(n, batch):
+	# chi-square of where each card lands over n decks; 51 degrees of freedom
+	service = shuffle.ShuffleService(seed = 0, batch = batch, background = False)
+	counts = np.zeros((52, 52))
+	positions = np.arange(52)
+	for _ in range(n):
+		counts[np.frombuffer(service.draw().deck, dtype=np.uint8), positions] += 1
+	expected = n / 52
+	return (((counts - expected) ** 2) / expected).sum(axis=1).max()
+
+def audit(n):
+	service = shuffle.ShuffleService(batch = 64, background = False)
+	failed = 0
+	for _ in range(n):
+		dealt = service.draw()
+		failed += not shuffle.verify(dealt.seed, dealt.commitment, dealt.deck)
+	return failed
+
+def main():
+	parser = argparse.ArgumentParser(description="Compare deck shuffling paths in decks/sec and check the CSPRNG decks")
+	parser.add_argument("--decks", type=int, default=100000)
+	parser.add_argument("--batch", type=int, default=shuffle.SHUFFLE_BATCH)
+	parser.add_argument("--uniformity", type=int, default=50000)
+	args = parser.parse_args()
+	print(f"per hand, random.shuffle      {rate(per_hand, args.decks):10.0f} decks/sec")
+	print(f"per hand, CSPRNG              {rate(per_hand_csprng, args.decks):10.0f} decks/sec")
+	print(f"{f'batched CSPRNG ({args.batch})':30s}{rate(batched, args.decks, args.batch):10.0f} decks/sec")
+	print(f"service draw()                {rate(drawn, args.decks, args.batch):10.0f} decks/sec")
+	chi = uniformity(args.uniformity, args.batch)
+	# 51 degrees of freedom: 1 in 10000 exceeds about 99.6 for any one card
+	print(f"worst card position chi-square over {args.uniformity} decks: {chi:.1f} (51 dof)")
+	failed = audit(1000)
+	print(f"commitment/seed audit: {failed} of 1000 failed")
+	sys.exit(1 if failed or chi > 110 else 0)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,163 @@
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "poker_server"))
+
+import sim
+import state
+import equity
+import commands
+from bots import RandomBot, CallingStation
+from engine import Poker
+from snapshots import Snapshots
+
+class Tables():
+	"""Stands in for TableManager; tables never run their actor, the driver
+	applies their commands."""
+
+	def __init__(self, loop, server):
+		self.loop = loop
+		self.server = server
+		self.tables = {}
+
+	def __iter__(self):
+		return iter(list(self.tables.values()))
+
+	def create(self, table_id, **kwargs):
+		if table_id not in self.tables:
+			self.tables[table_id] = Poker(self.loop, table_id, sio = self.server, **kwargs)
+			self.tables[table_id].runout_delay = 0
+		return self.tables[table_id]
+
+	def destroy(self, table_id):
+		return self.tables.pop(table_id, None)
+
+async def drain(table):
+	while not table.queue.empty():
+		await table.apply(table.queue.get_nowait())
+
+async def play(table, bots, moves):
+	# up to moves actions by whoever is to act; stops early at a hand boundary
+	hand = table.hands_played
+	for _ in range(moves):
+		if not table.hand_running or table.hands_played != hand:
+			return
+		seat = table.table.turn.action_player
+		await table.apply(commands.parse(None, table.table.name(seat), bots[seat].act(table.table, seat)))
+		await drain(table)
+
+def seated(tables):
+	# what the settled ledger holds, as reals: stacks as of the start of the hand in play
+	return {(seat.username, table.table_id): float(table.hand_start.get(seat.username, seat.chips) if table.hand_running else seat.chips)
+		for table in tables for seat in table.table.seats if seat}
+
+def fingerprint(table):
+	t = table.table
+	turn = state.dump(t.turn)
+	turn.pop("deadline")
+	wire = t.to_wire(reveal = True)
+	wire["turn"].pop("deadline")
+	return (wire, state.dump(t.hand), state.dump(t.round), turn, t.button, table.cards,
+		table.hand_start, table.hands_played, table.hand_running, table.record and [tuple(action[1:]) for action in table.record.actions])
+
+async def run(args):
+	loop = asyncio.get_event_loop()
+	server = sim.HeadlessServer()
+	rng = random.Random(0)
+	players = [RandomBot(f"p{i}", i) for i in range(args.players)]
+	tables = Tables(loop, server)
+	for t in range(args.tables):
+		table = tables.create(f"t{t}", seed = t)
+		for seat, bot in enumerate(players):
+			table.sit(bot.name, seat, 10000)
+		table.start_hand()
+		await drain(table)
+		await play(table, players, rng.randrange(12))
+		await table.notify_state()
+	failures = []
+	with tempfile.TemporaryDirectory() as tmp:
+		snaps = Snapshots(os.path.join(tmp, "tables.db"))
+		start = time.perf_counter()
+		rows, dropped = snaps.collect(tables)
+		per_table = (time.perf_counter() - start) / len(rows)
+		snaps.saved = {}
+		start = time.perf_counter()
+		await snaps.save(tables)
+		full = time.perf_counter() - start
+		size = sum(os.path.getsize(os.path.join(tmp, name)) for name in os.listdir(tmp)) / len(rows)
+		changed = rng.sample(list(tables), len(rows) // 10)
+		for table in changed:
+			await play(table, players, 1)
+			await table.notify_state()
+		start = time.perf_counter()
+		written = await snaps.save(tables)
+		incremental = time.perf_counter() - start
+		if written != len(changed):
+			failures.append(f"incremental pass wrote {written} tables, {len(changed)} changed")
+
+		ledger = seated(tables)
+		restored = Tables(loop, server)
+		start = time.perf_counter()
+		kept = await Snapshots(snaps.path).restore(restored, ledger)
+		restore = time.perf_counter() - start
+		for table in tables:
+			if fingerprint(table) != fingerprint(restored.tables[table.table_id]):
+				failures.append(f"{table.table_id} restored differently")
+		# the same players sit at every table, each seat kept on its own
+		if set(kept) != set(ledger):
+			failures.append(f"{len(set(kept))} seats kept of {len(ledger)}")
+
+		# restored hands play out to the next hand on both copies alike
+		callers = [CallingStation(bot.name) for bot in players]
+		finished = 0
+		for table in list(tables)[:args.verify]:
+			copy = restored.tables[table.table_id]
+			await drain(copy)
+			hand = table.hands_played
+			while table.hands_played == hand:
+				await play(table, callers, 1)
+				await play(copy, callers, 1)
+			# the next hand is dealt from another deck, so compare what the finished hand settled
+			if copy.hands_played != table.hands_played or copy.hand_start != table.hand_start:
+				failures.append(f"{table.table_id} played out differently after restore")
+			finished += 1
+
+		# a hand settled after the snapshot: the stale copy keeps seats, takes the ledger's stacks and drops the hand
+		stale = dict(ledger)
+		victim = next(table for table in tables if table.hand_running)
+		stale[(victim.table.seats[0].username, victim.table_id)] += 100
+		again = Tables(loop, server)
+		await Snapshots(snaps.path).restore(again, stale)
+		copy = again.tables[victim.table_id]
+		if copy.hand_running or copy.table.seats[0].chips != stale[(victim.table.seats[0].username, victim.table_id)]:
+			failures.append("stale snapshot resumed its hand")
+		if not all(type(seat.chips) is int for seat in copy.table.seats if seat):
+			failures.append("stale snapshot took float stacks from the ledger")
+		snaps.writer.shutdown()
+
+	print(f"{args.tables} tables, {args.players} players each")
+	print(f"snapshot on the loop      {per_table * 1e6:8.1f} us/table")
+	print(f"full pass                 {full * 1000:8.1f} ms   {size:.0f} bytes/table on disk")
+	print(f"incremental pass ({len(changed)} changed) {incremental * 1000:6.1f} ms")
+	print(f"restore {args.tables} tables        {restore * 1000:8.1f} ms")
+	print(f"{finished} restored hands played out alongside the originals")
+	print(f"{len(failures)} failures")
+	for failure in failures[:10]:
+		print("  ", failure)
+	equity.get_executor().shutdown(cancel_futures=True)
+	return 1 if failures else 0
+
+def main():
+	parser = argparse.ArgumentParser(description="Time table snapshots and restoring them, and check restored hands carry on exactly")
+	parser.add_argument("--tables", type=int, default=1000)
+	parser.add_argument("--players", type=int, default=6)
+	parser.add_argument("--verify", type=int, default=200)
+	sys.exit(asyncio.get_event_loop().run_until_complete(run(parser.parse_args())))
+
+if __name__ == "__main__":
+	main()
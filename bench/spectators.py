@@ -0,0 +1,61 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import contextlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "poker_server"))
+
+import sim
+import equity
+
+async def measure(args, tier):
+	harness = sim.random_table(args.players, args.seed, measure = True)
+	table = harness.table
+	table.spectator_tier = tier
+	for i in range(args.spectators):
+		table.add_user(f"rail-{i}", f"rail{i}", binary = i < args.spectators * args.binary)
+	notify = table.notify_state
+	spent = [0.0, 0]
+
+	async def notify_state(msg = "", reveal = False):
+		start = time.perf_counter()
+		await notify(msg, reveal)
+		spent[0] += time.perf_counter() - start
+		spent[1] += 1
+
+	table.notify_state = notify_state
+	start = time.perf_counter()
+	played = await harness.run(args.hands)
+	elapsed = time.perf_counter() - start
+	server = harness.server
+	return {
+		"hands_per_sec": played / elapsed,
+		"notify_ms": spent[0] / max(spent[1], 1) * 1000,
+		"emits_per_notify": server.emits / max(spent[1], 1),
+		"deliveries_per_notify": server.deliveries / max(spent[1], 1),
+		"encodes_per_notify": server.encodes / max(spent[1], 1),
+		"kib_per_hand": server.bytes / 1024 / max(played, 1),
+	}
+
+async def run(args):
+	print(f"{args.players} players + {args.spectators} spectators ({args.binary:.0%} binary), {args.hands} hands")
+	for tier in (False, True):
+		with contextlib.redirect_stdout(open(os.devnull, "w")):
+			result = await measure(args, tier)
+		print(f"{'spectator room' if tier else 'per viewer':>14}: notify {result['notify_ms']:8.2f} ms  emits/notify {result['emits_per_notify']:7.1f}"
+			f"  deliveries/notify {result['deliveries_per_notify']:7.1f}  encodes/notify {result['encodes_per_notify']:7.1f}  KiB/hand {result['kib_per_hand']:9.1f}  hands/sec {result['hands_per_sec']:.2f}")
+	equity.get_executor().shutdown(cancel_futures=True)
+
+def main():
+	parser = argparse.ArgumentParser(description="Compare per-viewer state fan-out with the shared spectator frame")
+	parser.add_argument("--players", type=int, default=9)
+	parser.add_argument("--spectators", type=int, default=1000)
+	parser.add_argument("--binary", type=float, default=0.0, help="fraction of spectators on the binary wire")
+	parser.add_argument("--hands", type=int, default=20)
+	parser.add_argument("--seed", type=int, default=0)
+	asyncio.get_event_loop().run_until_complete(run(parser.parse_args()))
+
+if __name__ == "__main__":
+	main()
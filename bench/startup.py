@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+import tempfile
+import argparse
+import subprocess
+
+SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "poker_server")
+
+# What a cold worker process imports, each timed in a fresh interpreter.
+TARGETS = {
+	"interpreter": "pass",
+	"engine": "import engine",
+	"equity": "import equity",
+	"app": "import poker",
+	"app + create_app": "import poker; poker.create_app()",
+}
+
+def spawn(code, env):
+	start = time.perf_counter()
+	result = subprocess.run([sys.executable, "-c", f"import sys; sys.path.insert(0, {SERVER!r}); {code}"],
+		cwd = SERVER, env = env, capture_output = True, text = True)
+	elapsed = time.perf_counter() - start
+	if result.returncode:
+		return None, result.stderr.strip().splitlines()[-1]
+	return elapsed, None
+
+def measure(code, runs, env):
+	times = []
+	for _ in range(runs):
+		elapsed, error = spawn(code, env)
+		if error:
+			return None, error
+		times.append(elapsed)
+	times.sort()
+	return times[len(times) // 2], None
+
+def main():
+	parser = argparse.ArgumentParser(description="Time cold worker process startup")
+	parser.add_argument("--runs", type=int, default=5)
+	parser.add_argument("--budget", type=float, default=400, help="ms allowed to import the engine with a warm evaluator cache")
+	args = parser.parse_args()
+	env = dict(os.environ, TEMPLATES_PATH = os.path.join(SERVER, "..", "templates"))
+	with tempfile.TemporaryDirectory() as scratch:
+		# first spawn of a fresh install builds the evaluator tables
+		cold = dict(env, EVALUATOR_CACHE = os.path.join(scratch, "tables.pickle"))
+		elapsed, error = spawn("import evaluator", cold)
+		print(f"{'evaluator, no cache':20s} {elapsed * 1000:8.1f} ms" if error is None else f"{'evaluator, no cache':20s} failed: {error}")
+	failed = False
+	for name, code in TARGETS.items():
+		median, error = measure(code, args.runs, env)
+		if error:
+			print(f"{name:20s} skipped: {error}")
+			continue
+		print(f"{name:20s} {median * 1000:8.1f} ms")
+		if name == "engine" and median * 1000 > args.budget:
+			print(f"REGRESSION engine import {median * 1000:.1f}ms > {args.budget}ms")
+			failed = True
+	sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+	main()
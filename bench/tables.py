@@ -0,0 +1,90 @@
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import functools
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, os.path.join(ROOT, "poker_server"))
+os.environ.setdefault("TEMPLATES_PATH", os.path.join(ROOT, "templates"))
+
+import equity
+import commands
+import timers
+from engine import Poker
+from sim import HeadlessServer
+from tables import TableManager
+
+async def bot(table, username, rng, delay):
+	while True:
+		await asyncio.sleep(delay)
+		seat = table.table.seat_of(username)
+		if not table.is_turn(seat):
+			continue
+		turn = table.table.turn
+		owed = turn.bet_size - table.table.round.chips_out[seat]
+		roll = rng.random()
+		if owed > 0:
+			action = "fold" if roll < 0.2 else "call"
+		else:
+			action = "raise" if roll < 0.1 else "check"
+		data = {"action": action}
+		if action == "raise":
+			data["amount"] = turn.bet_size + table.table.big_blind
+		await table.on_json(None, username, data)
+
+async def lag_monitor(loop, samples, interval):
+	while True:
+		start = loop.time()
+		await asyncio.sleep(interval)
+		samples.append(loop.time() - start - interval)
+
+async def run(args):
+	loop = asyncio.get_event_loop()
+	rng = random.Random(args.seed)
+	server = HeadlessServer(measure = True)
+	tables = TableManager(loop, functools.partial(Poker, sio = server))
+	bots = []
+	for t in range(args.tables):
+		table = tables.create(f"bench{t}")
+		table.turn_time = args.turn_time
+		for seat in range(args.players):
+			username = f"bot{t}-{seat}"
+			table.sit(username, seat, args.stack)
+			table.add_user(f"sid-{username}", username)
+			bots.append(loop.create_task(bot(table, username, rng, args.think)))
+		table.submit(commands.Start())
+	lag = []
+	monitor = loop.create_task(lag_monitor(loop, lag, 0.05))
+	start = time.perf_counter()
+	await asyncio.sleep(args.duration)
+	elapsed = time.perf_counter() - start
+	hands = sum(table.hands_played for table in tables)
+	for task in bots + [monitor]:
+		task.cancel()
+	for table in tables:
+		tables.destroy(table.table_id)
+	# equity jobs for hands long finished would otherwise hold up exit
+	equity.get_executor().shutdown(cancel_futures=True)
+	lag.sort()
+	print(f"{args.tables} tables x {args.players} bots for {elapsed:.1f}s")
+	print(f"hands: {hands}  hands/sec: {hands / elapsed:.1f}")
+	print(f"emits/sec: {server.emits / elapsed:.1f}  KiB/sec: {server.bytes / elapsed / 1024:.1f}  timer wakeups/sec: {timers.get_wheel().wakeups / elapsed:.1f}")
+	if lag:
+		print(f"loop lag ms  p50: {lag[len(lag) // 2] * 1000:.2f}  p99: {lag[int(len(lag) * 0.99)] * 1000:.2f}  max: {lag[-1] * 1000:.2f}")
+
+def main():
+	parser = argparse.ArgumentParser(description="Simulate many bot-filled tables in one process")
+	parser.add_argument("--tables", type=int, default=100)
+	parser.add_argument("--players", type=int, default=9)
+	parser.add_argument("--duration", type=float, default=30)
+	parser.add_argument("--turn-time", type=int, default=10)
+	parser.add_argument("--think", type=float, default=0.01, help="bot polling interval in seconds")
+	parser.add_argument("--stack", type=int, default=10000)
+	parser.add_argument("--seed", type=int, default=0)
+	asyncio.get_event_loop().run_until_complete(run(parser.parse_args()))
+
+if __name__ == "__main__":
+	main()
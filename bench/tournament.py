@@ -0,0 +1,179 @@
+import os
+import sys
+import math
+import time
+import random
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "poker_server"))
+
+import sim
+import equity
+from engine import Poker
+from tournament import Director
+
+class SimTables():
+	"""Stands in for TableManager. Tables are real Poker objects that never run
+	their actor; commands the director sends them are applied by the driver."""
+
+	def __init__(self, loop):
+		self.loop = loop
+		self.server = sim.HeadlessServer()
+		self.tables = {}
+		self.order = []
+		self.pending = set()
+
+	def create(self, table_id, **kwargs):
+		table = Poker(self.loop, table_id, sio = self.server, **kwargs)
+		table.hand_running = True
+		table.submit = lambda command, table = table: (table.queue.put_nowait(command), self.pending.add(table))
+		self.tables[table_id] = table
+		self.order.append(table)
+		return table
+
+	def get(self, table_id):
+		return self.tables.get(table_id)
+
+	def destroy(self, table_id):
+		return self.tables.pop(table_id, None)
+
+	def pick(self, rng):
+		while True:
+			i = rng.randrange(len(self.order))
+			table = self.order[i]
+			if table.table_id in self.tables:
+				return table
+			self.order[i] = self.order[-1]
+			self.order.pop()
+
+	async def drain(self):
+		while self.pending:
+			table = self.pending.pop()
+			while not table.queue.empty():
+				await table.apply(table.queue.get_nowait())
+
+def play_hand(table, rng, shove):
+	# Two seated players clash; an all-in loses the smaller stack outright.
+	seats = table.table.occupied()
+	winner, loser = (table.table.seats[seat] for seat in rng.sample(seats, 2))
+	table.hand_start = {seat.username: seat.chips for seat in table.table.seats if seat}
+	amount = min(winner.chips, loser.chips) if rng.random() < shove else min(loser.chips, rng.randint(1, max(1, loser.chips // 4)))
+	loser.chips -= amount
+	winner.chips += amount
+
+async def run_event(entrants, seed, shove):
+	loop = asyncio.get_event_loop()
+	rng = random.Random(seed)
+	tables = SimTables(loop)
+	director = Director(loop, f"mtt{entrants}", tables, buy_in = 100, stack = 10000, ledger = None, seed = seed)
+	for i in range(entrants):
+		await director.register(f"p{i}")
+	start = time.perf_counter()
+	director.start()
+	await tables.drain()
+	hands = 0
+	while director.remaining > 1:
+		table = tables.pick(rng)
+		play_hand(table, rng, shove)
+		await director.hand_ended(table)
+		await tables.drain()
+		await asyncio.sleep(0) # let broken tables be destroyed
+		hands += 1
+	elapsed = time.perf_counter() - start
+	places = sorted(director.places.values())
+	assert places == list(range(1, entrants + 1)), "finishing places are not 1..N"
+	return {
+		"tables": math.ceil(entrants / director.seats),
+		"hands": hands,
+		"moves": director.moves,
+		"us_per_boundary": director.boundary_seconds / max(director.boundaries, 1) * 1e6,
+		"seconds": elapsed,
+	}
+
+async def crowded_break():
+	# 12 players at 9 and 3; two bust on the short table in one hand, and its
+	# last player must not be sent to the full one
+	loop = asyncio.get_event_loop()
+	tables = SimTables(loop)
+	director = Director(loop, "mtt-crowded", tables, buy_in = 100, stack = 10000, ledger = None, seed = 0)
+	for i in range(12):
+		await director.register(f"p{i}")
+	director.start()
+	await tables.drain()
+	full, short = (tables.get(f"mtt-crowded.{i}") for i in range(2))
+	for _ in range(3):
+		await director.move(short, short.table.occupied()[-1], full.table_id)
+	await tables.drain()
+	for seat in short.table.occupied()[:2]:
+		short.table.seats[seat].chips = 0
+	await director.hand_ended(short)
+	await tables.drain()
+	await asyncio.sleep(0)
+	await director.hand_ended(full)
+	await tables.drain()
+	seated = sum(len(table.table.occupied()) for table in tables.tables.values())
+	return seated == director.remaining == 10 and max(director.counts.values()) <= director.seats
+
+class Ledger():
+	def __init__(self):
+		self.balance = {}
+		self.seated = set()
+
+	async def join(self, username, amount, tournament_id):
+		self.balance[username] = self.balance.get(username, 0) - amount
+		self.seated.add(username)
+		return "success"
+
+	async def leave(self, username, amount, tournament_id):
+		self.balance[username] += amount
+		self.seated.discard(username)
+		return "success"
+
+async def lone_entrant():
+	# nobody to play against: the buy-in comes back and the seat is released
+	loop = asyncio.get_event_loop()
+	ledger = Ledger()
+	director = Director(loop, "mtt-lone", SimTables(loop), buy_in = 100, stack = 10000, ledger = ledger, seed = 0)
+	await director.register("solo")
+	await director.run()
+	return ledger.balance == {"solo": 0} and not ledger.seated and director.places == {"solo": 1}
+
+async def run(args):
+	results = []
+	for entrants in args.entrants:
+		result = await run_event(entrants, args.seed, args.shove)
+		results.append(result)
+		print(f"{entrants:6d} entrants {result['tables']:5d} tables: {result['hands']:6d} hands  {result['moves']:6d} moves"
+			f"  {result['us_per_boundary']:7.1f} us/boundary  {result['seconds']:6.2f}s total")
+	equity.get_executor().shutdown(cancel_futures=True)
+	failed = False
+	if not await crowded_break():
+		print("REGRESSION a table broke onto a full one")
+		failed = True
+	if not await lone_entrant():
+		print("REGRESSION a lone entrant was not refunded")
+		failed = True
+	first, last = results[0], results[-1]
+	growth = math.log(max(last["us_per_boundary"], 1e-9) / first["us_per_boundary"]) / math.log(last["tables"] / first["tables"])
+	print(f"boundary cost grows as tables^{growth:.2f}")
+	if growth >= args.max_exponent:
+		print(f"REGRESSION balancing cost exponent {growth:.2f} >= {args.max_exponent}")
+		failed = True
+	for entrants, result in zip(args.entrants, results):
+		if entrants >= 10000 and result["seconds"] > args.budget:
+			print(f"REGRESSION {entrants} entrants took {result['seconds']:.1f}s > {args.budget}s")
+			failed = True
+	return 1 if failed else 0
+
+def main():
+	parser = argparse.ArgumentParser(description="Simulate tournaments to time the director's balancing and table breaking")
+	parser.add_argument("--entrants", type=int, nargs="+", default=[1000, 2500, 5000, 10000, 20000])
+	parser.add_argument("--shove", type=float, default=0.3, help="chance a simulated hand is an all-in")
+	parser.add_argument("--budget", type=float, default=60, help="seconds allowed for a 10k+ entrant event")
+	parser.add_argument("--max-exponent", type=float, default=0.5)
+	parser.add_argument("--seed", type=int, default=0)
+	sys.exit(asyncio.get_event_loop().run_until_complete(run(parser.parse_args())))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,107 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import contextlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "poker_server"))
+
+import sim
+import wire
+import equity
+from commands import CommandError
+
+ACTIONS = [{"action": "join", "seat": 3, "amount": 20000}, {"action": "raise", "amount": 450}, {"action": "fold"},
+	{"action": "watch", "table": "main"}, {"action": "lobby"}, {"action": "register", "tournament": "sunday"}]
+BAD_FRAMES = [b"", b"\xff", b"\x00", b"\x00\x03\x80", b"\x04", b"\x08\x09ma", b"\x0a\x02\xff\xfe"]
+
+def check_actions():
+	failures = [f"{data} came back as {wire.decode_action(wire.encode_action(data))}" for data in ACTIONS
+		if wire.decode_action(wire.encode_action(data)) != data]
+	for frame in BAD_FRAMES:
+		try:
+			wire.decode_action(frame)
+			failures.append(f"{frame!r} decoded")
+		except CommandError:
+			pass
+	return failures
+
+def normalize(state):
+	# JSON keeps describe() tuples as lists; equity is compared separately
+	# because the wire quantizes it to 1/65535
+	state = json.loads(json.dumps(state))
+	equity = state["hand"].pop("equity")
+	state["turn"]["deadline"] = round(state["turn"]["deadline"], 3)
+	return state, equity
+
+def same(decoded, full):
+	(decoded, decoded_equity), (full, full_equity) = normalize(decoded), normalize(full)
+	return decoded == full and decoded_equity.keys() == full_equity.keys() and all(abs(decoded_equity[name] - full_equity[name]) <= 1 / wire.EQUITY_SCALE for name in full_equity)
+
+async def collect(players, hands, seed):
+	harness = sim.random_table(players, seed, measure = True)
+	table = harness.table
+	sizes = {"json": 0, "patch": 0, "binary": 0}
+	samples = []
+	mismatches = 0
+	notify = table.notify_state
+
+	async def notify_state(msg = "", reveal = False):
+		before = harness.server.bytes
+		await notify(msg, reveal)
+		sizes["patch"] += harness.server.bytes - before
+		for username in table.users:
+			full = table.full_view(table.table.private_wire(username, reveal))
+			encoded = wire.encode_state(table.table, username, table.version, msg, reveal)
+			sizes["json"] += len(json.dumps(full))
+			sizes["binary"] += len(encoded)
+			if len(samples) < 2000:
+				samples.append((full, username, reveal, msg, table.version))
+			nonlocal mismatches
+			if not same(wire.decode_state(encoded, username), full):
+				mismatches += 1
+
+	table.notify_state = notify_state
+	played = await harness.run(hands)
+	return played, sizes, mismatches, samples, table
+
+def throughput(samples, table, rounds):
+	start = time.perf_counter()
+	for _ in range(rounds):
+		for full, username, reveal, msg, seq in samples:
+			json.dumps(full)
+	json_time = time.perf_counter() - start
+	start = time.perf_counter()
+	for _ in range(rounds):
+		for full, username, reveal, msg, seq in samples:
+			wire.encode_state(table.table, username, seq, msg, reveal)
+	binary_time = time.perf_counter() - start
+	count = len(samples) * rounds
+	return count / json_time, count / binary_time
+
+async def run(args):
+	failures = check_actions()
+	print(f"action frames: {len(ACTIONS)} round-tripped, {len(BAD_FRAMES)} bad frames, {len(failures)} failures")
+	for failure in failures:
+		print("  ", failure)
+	for players in (2, 6, 9):
+		with contextlib.redirect_stdout(open(os.devnull, "w")):
+			played, sizes, mismatches, samples, table = await collect(players, args.hands, args.seed)
+		json_rate, binary_rate = throughput(samples, table, args.rounds)
+		print(f"{players} players, {played} hands: bytes/hand json {sizes['json'] / played:.0f}  json+patch {sizes['patch'] / played:.0f}  binary {sizes['binary'] / played:.0f}"
+			f"  ({sizes['json'] / max(sizes['binary'], 1):.1f}x smaller than full json)")
+		print(f"  encodes/sec json.dumps {json_rate:.0f}  wire.encode_state {binary_rate:.0f}  round-trip mismatches: {mismatches}")
+	equity.get_executor().shutdown(cancel_futures=True)
+	return 1 if failures else 0
+
+def main():
+	parser = argparse.ArgumentParser(description="Compare JSON and binary state payload sizes and encode speed")
+	parser.add_argument("--hands", type=int, default=200)
+	parser.add_argument("--rounds", type=int, default=5)
+	parser.add_argument("--seed", type=int, default=0)
+	sys.exit(asyncio.get_event_loop().run_until_complete(run(parser.parse_args())))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,75 @@
+import os
+import time
+import asyncio
+import hashlib
+import collections
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+import metrics
+
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 50000))
+TOKEN_WORKERS = int(os.getenv("TOKEN_WORKERS", 2))
+# for tokens without an exp claim
+TOKEN_TTL = float(os.getenv("TOKEN_TTL", 300))
+
+def cookie_token(environ):
+	cookies = SimpleCookie()
+	cookies.load(environ.get('HTTP_COOKIE', ''))
+	return cookies['access_token'].value if 'access_token' in cookies else None
+
+class TokenCache():
+	"""Verified access tokens, so a storm of reconnects does not decode the
+	same JWTs on the game loop again. Entries are keyed by a hash of the
+	token, expire with its exp claim and are evicted least recently used
+	first. A miss is decoded on a thread pool; connects waiting on the same
+	token share one decode."""
+
+	def __init__(self, secret, size = TOKEN_CACHE_SIZE, workers = TOKEN_WORKERS):
+		self.secret = secret
+		self.size = size
+		self.entries = collections.OrderedDict()
+		self.pending = {}
+		self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="token-verify")
+
+	@staticmethod
+	def key(token):
+		return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+	def get(self, key, now = None):
+		entry = self.entries.get(key)
+		if entry is None:
+			return None
+		username, expires = entry
+		if expires <= (now if now is not None else time.time()):
+			del self.entries[key]
+			return None
+		self.entries.move_to_end(key)
+		return username
+
+	def put(self, key, username, expires):
+		self.entries[key] = (username, expires)
+		self.entries.move_to_end(key)
+		while len(self.entries) > self.size:
+			self.entries.popitem(last=False)
+
+	def decode(self, token):
+		import jwt
+		payload = jwt.decode(token, self.secret)
+		return payload['user_id'], payload.get('exp', time.time() + TOKEN_TTL)
+
+	async def verify(self, token):
+		"""The username the token was issued to. Raises whatever jwt.decode
+		raises for a bad or expired token; failures are not cached."""
+		key = self.key(token)
+		username = self.get(key)
+		if username is not None:
+			metrics.token_checks.inc("hit")
+			return username
+		metrics.token_checks.inc("miss")
+		future = self.pending.get(key)
+		if future is None:
+			future = self.pending[key] = asyncio.get_event_loop().run_in_executor(self.executor, self.decode, token)
+			future.add_done_callback(lambda _: self.pending.pop(key, None))
+		username, expires = await future
+		self.put(key, username, expires)
+		return username
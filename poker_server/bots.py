@@ -0,0 +1,112 @@
+import os
+import time
+import random
+import numpy as np
+import evaluator
+import equity
+import state
+
+BOT_SAMPLES = int(os.getenv("BOT_SAMPLES", 400))
+BOT_BUDGET = float(os.getenv("BOT_BUDGET", 0.05))
+# runouts sampled between budget checks
+BATCH_SIZE = 100
+
+class Bot():
+	"""A seat driven in-process. act() sees the live table and its own seat
+	and returns the same dict a client would send as a json action. A pooled
+	bot also splits act() into spot(), read on the loop, and decide(), a
+	plain function of the spot that can run in a worker process."""
+
+	pooled = False
+
+	def __init__(self, name, seed = None):
+		self.name = name
+		self.rng = random.Random(seed)
+
+	def act(self, table, seat):
+		raise NotImplementedError
+
+	@staticmethod
+	def owed(table, seat):
+		return table.turn.bet_size - table.round.chips_out[seat]
+
+class CallingStation(Bot):
+
+	def act(self, table, seat):
+		return {"action": "call" if self.owed(table, seat) > 0 else "check"}
+
+class RandomBot(Bot):
+
+	def __init__(self, name, seed = None, fold = 0.2, raise_ = 0.1):
+		super().__init__(name, seed)
+		self.fold = fold
+		self.raise_ = raise_
+
+	def act(self, table, seat):
+		roll = self.rng.random()
+		if self.owed(table, seat) > 0:
+			return {"action": "fold" if roll < self.fold else "call"}
+		if roll < self.raise_:
+			# short of a full raise it shoves
+			stack = table.round.chips_out[seat] + table.seats[seat].chips
+			return {"action": "raise", "amount": min(table.turn.bet_size + table.big_blind, stack)}
+		return {"action": "check"}
+
+def estimate(hole, board, opponents, samples = BOT_SAMPLES, budget = BOT_BUDGET, seed = None):
+	"""Share of the pot hole wins against random hands for each opponent,
+	from up to samples runouts or however many fit in the budget."""
+	deadline = time.perf_counter() + budget
+	rng = np.random.default_rng(seed)
+	known = set(hole) | set(board)
+	deck = np.array([card for card in range(52) if card not in known], dtype=np.int64)
+	missing = 5 - len(board)
+	won = 0.0
+	runs = 0
+	while runs < samples and (not runs or time.perf_counter() < deadline):
+		size = min(BATCH_SIZE, samples - runs)
+		drawn = deck[rng.random((size, len(deck))).argsort(axis=1)[:, :missing + 2 * opponents]]
+		full = np.concatenate([np.broadcast_to(np.array(board, dtype=np.int64), (size, len(board))), drawn[:, :missing]], axis=1)
+		mine = equity.evaluate_batch(np.concatenate([full, np.broadcast_to(np.array(hole, dtype=np.int64), (size, 2))], axis=1))
+		best = np.max([equity.evaluate_batch(np.concatenate([full, drawn[:, i:i + 2]], axis=1)) for i in range(missing, missing + 2 * opponents, 2)], axis=0)
+		won += (mine > best).sum() + 0.5 * (mine == best).sum()
+		runs += size
+	return float(won / runs)
+
+def decide(hole, board, opponents, owed, pot, bet_size, stack, big_blind, samples = BOT_SAMPLES, budget = BOT_BUDGET, seed = None):
+	share = estimate(hole, board, opponents, samples, budget, seed)
+	if share > max(0.5, 2 / (opponents + 1)) and stack > bet_size:
+		# stack counts what is already out this round; short of the raise it shoves
+		return {"action": "raise", "amount": min(bet_size + max(big_blind, pot // 2), stack)}
+	if owed <= 0:
+		return {"action": "check"}
+	if share * (pot + owed) >= owed:
+		return {"action": "call"}
+	return {"action": "fold"}
+
+class EquityBot(Bot):
+	"""Raises when well ahead of its fair share against the players still in,
+	calls when the pot lays the price and otherwise checks or folds."""
+
+	pooled = True
+
+	def __init__(self, name, seed = None, samples = BOT_SAMPLES, budget = BOT_BUDGET):
+		super().__init__(name, seed)
+		self.samples = samples
+		self.budget = budget
+
+	def spot(self, table, seat):
+		hand, rnd = table.hand, table.round
+		return (evaluator.to_indices(hand.hole_cards[seat]), evaluator.to_indices(hand.community_cards),
+			state.COUNT[hand.live] - 1, self.owed(table, seat), hand.pot + sum(rnd.chips_out), table.turn.bet_size,
+			rnd.chips_out[seat] + table.seats[seat].chips, table.big_blind, self.samples, self.budget, self.rng.getrandbits(63))
+
+	decide = staticmethod(decide)
+
+	def act(self, table, seat):
+		return self.decide(*self.spot(table, seat))
+
+STRATEGIES = {
+	"calling": CallingStation,
+	"random": RandomBot,
+	"equity": EquityBot,
+}
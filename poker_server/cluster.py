@@ -0,0 +1,233 @@
+import os
+import sys
+import bisect
+import pickle
+import struct
+import asyncio
+import hashlib
+import argparse
+import subprocess
+import socketio
+from socketio import packet
+import settlement
+import seatfill
+
+BUS_PATH = os.getenv("BUS_PATH")
+WORKER_INDEX = int(os.getenv("WORKER_INDEX", 0))
+WORKER_COUNT = int(os.getenv("WORKER_COUNT", 1))
+WORKER_BASE_PORT = int(os.getenv("WORKER_BASE_PORT", 5000))
+FRAME = struct.Struct("!I")
+
+def _hash(key):
+	return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+class HashRing():
+
+	def __init__(self, workers, replicas = 100):
+		self.points = sorted((_hash(f"{worker}:{i}"), worker) for worker in range(workers) for i in range(replicas))
+		self.keys = [point for point, worker in self.points]
+		self.moved = {}
+
+	def owner(self, table_id):
+		if table_id in self.moved:
+			return self.moved[table_id]
+		i = bisect.bisect(self.keys, _hash(table_id)) % len(self.keys)
+		return self.points[i][1]
+
+	def move(self, table_id, worker):
+		self.moved[table_id] = worker
+
+ring = HashRing(WORKER_COUNT)
+
+def owns(table_id):
+	return ring.owner(table_id) == WORKER_INDEX
+
+def worker_port(worker):
+	return WORKER_BASE_PORT + worker
+
+async def read_frame(reader):
+	size = FRAME.unpack(await reader.readexactly(FRAME.size))[0]
+	return pickle.loads(await reader.readexactly(size))
+
+def write_frame(writer, message):
+	payload = pickle.dumps(message)
+	writer.write(FRAME.pack(len(payload)) + payload)
+
+class BusHub():
+	"""Relays every frame to every connected worker, the sender included, and
+	remembers table moves so late joiners learn the current ring overrides."""
+
+	def __init__(self, path):
+		self.path = path
+		self.writers = set()
+		self.moved = {}
+
+	async def serve(self):
+		if os.path.exists(self.path):
+			os.unlink(self.path)
+		return await asyncio.start_unix_server(self.handle, path=self.path)
+
+	async def handle(self, reader, writer):
+		for table_id, worker in self.moved.items():
+			write_frame(writer, {"channel": "tables", "data": {"type": "moved", "table": table_id, "worker": worker}})
+		self.writers.add(writer)
+		try:
+			while True:
+				message = await read_frame(reader)
+				data = message.get("data")
+				if message.get("channel") == "tables" and data.get("type") == "moved":
+					self.moved[data["table"]] = data["worker"]
+				for peer in list(self.writers):
+					write_frame(peer, message)
+		except (asyncio.IncompleteReadError, ConnectionError):
+			pass
+		finally:
+			self.writers.discard(writer)
+			writer.close()
+
+class Bus():
+
+	def __init__(self, path):
+		self.path = path
+		self.writer = None
+		self.channels = {}
+		self.connecting = None
+
+	async def connect(self):
+		if self.connecting is None:
+			self.connecting = asyncio.ensure_future(self._connect())
+		await self.connecting
+
+	async def _connect(self):
+		reader, self.writer = await asyncio.open_unix_connection(self.path)
+		asyncio.ensure_future(self._read(reader))
+
+	async def _read(self, reader):
+		while True:
+			message = await read_frame(reader)
+			self.subscribe(message["channel"]).put_nowait(message["data"])
+
+	def subscribe(self, channel):
+		if channel not in self.channels:
+			self.channels[channel] = asyncio.Queue()
+		return self.channels[channel]
+
+	async def publish(self, channel, data):
+		await self.connect()
+		write_frame(self.writer, {"channel": channel, "data": data})
+		await self.writer.drain()
+
+	async def listen(self, channel):
+		await self.connect()
+		queue = self.subscribe(channel)
+		while True:
+			yield await queue.get()
+
+_bus = None
+
+def bus():
+	global _bus
+	if _bus is None and BUS_PATH:
+		_bus = Bus(BUS_PATH)
+	return _bus
+
+class UnixSocketManager(socketio.AsyncPubSubManager):
+	name = "unix"
+
+	def __init__(self, bus, channel = "socketio", write_only = False, logger = None):
+		super().__init__(channel=channel, write_only=write_only, logger=logger)
+		self.bus = bus
+
+	async def _publish(self, data):
+		await self.bus.publish(self.channel, data)
+
+	async def _listen(self):
+		async for data in self.bus.listen(self.channel):
+			yield data
+
+class Server(socketio.AsyncServer):
+
+	async def emit_shared(self, event, data, to, namespace = "/"):
+		"""emit() to a room with the packet encoded once. socket.io 4 encodes
+		an event again for each recipient; this hands every sid in the room
+		the same encoded packet through engine.io. Only this worker's sids,
+		which is where a table's viewers are connected."""
+		encoded = packet.Packet(packet.EVENT, namespace = namespace, data = [event, data]).encode()
+		try:
+			sids = list(self.manager.get_participants(namespace, to))
+		except KeyError:
+			return
+		for sid in sids:
+			if isinstance(encoded, list):
+				# binary: the header then each attachment
+				for i, part in enumerate(encoded):
+					await self.eio.send(sid, part, binary = i > 0)
+			else:
+				await self.eio.send(sid, encoded, binary = False)
+
+def client_manager():
+	return UnixSocketManager(bus()) if bus() else None
+
+async def request_migration(table_id, worker):
+	await bus().publish("tables", {"type": "migrate", "table": table_id, "worker": worker})
+
+async def serve_tables(tables):
+	"""Handles migration traffic for this worker. The owner hands a table off at
+	its next hand boundary and the target adopts it from the exported state."""
+	async def handoff(table):
+		state = table.export()
+		await bus().publish("tables", {"type": "adopt", "table": table.table_id, "worker": table.migrating, "state": state})
+		await bus().publish("tables", {"type": "moved", "table": table.table_id, "worker": table.migrating})
+		await table.sio.send({"moved": table.migrating, "port": worker_port(table.migrating)}, to=table.room())
+		tables.destroy(table.table_id)
+		for username in state["bots"]:
+			table.bots.release(username)
+
+	async for message in bus().listen("tables"):
+		table_id = message["table"]
+		if message["type"] == "moved":
+			ring.move(table_id, message["worker"])
+		elif message["type"] == "migrate":
+			table = tables.get(table_id)
+			if table and message["worker"] != WORKER_INDEX:
+				table.migrate(message["worker"], handoff)
+		elif message["type"] == "adopt" and message["worker"] == WORKER_INDEX:
+			ring.move(table_id, WORKER_INDEX)
+			state = message["state"]
+			tables.create(table_id, **(seatfill.table_options() if state.get("play_money") else {})).restore(state)
+
+def main():
+	parser = argparse.ArgumentParser(description="Run poker workers that shard tables over a local message bus")
+	parser.add_argument("--bus", default=BUS_PATH or "/tmp/poker-bus.sock")
+	parser.set_defaults(workers=os.cpu_count(), base_port=WORKER_BASE_PORT)
+	sub = parser.add_subparsers(dest="command")
+	run = sub.add_parser("run")
+	run.add_argument("--workers", type=int, default=os.cpu_count())
+	run.add_argument("--base-port", type=int, default=WORKER_BASE_PORT)
+	migrate = sub.add_parser("migrate")
+	migrate.add_argument("table")
+	migrate.add_argument("worker", type=int)
+	args = parser.parse_args()
+	loop = asyncio.get_event_loop()
+
+	if args.command == "migrate":
+		global _bus
+		_bus = Bus(args.bus)
+		loop.run_until_complete(request_migration(args.table, args.worker))
+		return
+
+	loop.run_until_complete(BusHub(args.bus).serve())
+	script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "poker.py")
+	workers = []
+	for index in range(args.workers):
+		env = dict(os.environ, BUS_PATH=args.bus, WORKER_INDEX=str(index), WORKER_COUNT=str(args.workers), WORKER_BASE_PORT=str(args.base_port),
+			JOURNAL_PATH=f"{settlement.JOURNAL_PATH}.{index}")
+		workers.append(subprocess.Popen([sys.executable, script], env=env))
+	try:
+		loop.run_forever()
+	finally:
+		for worker in workers:
+			worker.terminate()
+
+if __name__ == "__main__":
+	main()
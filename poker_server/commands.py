@@ -0,0 +1,125 @@
+import time
+from state import SEATS
+
+# Socket handlers only parse client messages into these and hand them to the
+# table; the table's actor is the one place that applies them to state.
+
+class CommandError(Exception):
+	pass
+
+class Command():
+	__slots__ = ("sid", "username", "at")
+	action = ""
+
+	def __init__(self, sid = None, username = None):
+		self.sid = sid
+		self.username = username
+		self.at = time.perf_counter()
+
+class Join(Command):
+	__slots__ = ("seat", "amount")
+	action = "join"
+
+	def __init__(self, sid, username, seat, amount):
+		super().__init__(sid, username)
+		self.seat = seat
+		self.amount = amount
+
+class Leave(Command):
+	__slots__ = ()
+	action = "leave"
+
+class Check(Command):
+	__slots__ = ()
+	action = "check"
+
+class Call(Command):
+	__slots__ = ()
+	action = "call"
+
+class Raise(Command):
+	__slots__ = ("amount",)
+	action = "raise"
+
+	def __init__(self, sid, username, amount):
+		super().__init__(sid, username)
+		self.amount = amount
+
+class Fold(Command):
+	__slots__ = ()
+	action = "fold"
+
+class Resync(Command):
+	__slots__ = ()
+	action = "state"
+
+# Internal commands, queued by the table itself rather than by a client.
+
+class Start(Command):
+	__slots__ = ()
+	action = "start"
+
+class Timeout(Command):
+	__slots__ = ("turn_no",)
+	action = "timeout"
+
+	def __init__(self, turn_no):
+		super().__init__()
+		self.turn_no = turn_no
+
+class Migrate(Command):
+	__slots__ = ()
+	action = "migrate"
+
+class Advance(Command):
+	__slots__ = ("hand",)
+	action = "advance"
+
+	def __init__(self, hand = None):
+		# with a hand, the next street of that hand's runout is due
+		super().__init__()
+		self.hand = hand
+
+class Arrive(Command):
+	__slots__ = ("chips",)
+	action = "arrive"
+
+	def __init__(self, username, chips):
+		super().__init__()
+		self.username = username
+		self.chips = chips
+
+class Equity(Command):
+	__slots__ = ("hand", "board", "shares")
+	action = "equity"
+
+	def __init__(self, hand, board, shares):
+		super().__init__()
+		self.hand = hand
+		self.board = board
+		self.shares = shares
+
+MOVES = (Check, Call, Raise, Fold)
+
+def _int(data, key):
+	try:
+		return int(data[key])
+	except (KeyError, TypeError, ValueError):
+		raise CommandError(f"'{key}' must be a number")
+
+def parse(sid, username, data):
+	action = data.get("action") if isinstance(data, dict) else None
+	if action == "join":
+		seat = _int(data, "seat")
+		amount = _int(data, "amount")
+		if not 0 <= seat < SEATS:
+			raise CommandError("no such seat")
+		if amount <= 0:
+			raise CommandError("buy-in must be positive")
+		return Join(sid, username, seat, amount)
+	if action == "raise":
+		return Raise(sid, username, _int(data, "amount"))
+	command = {"leave": Leave, "check": Check, "call": Call, "fold": Fold, "state": Resync}.get(action)
+	if command is None:
+		raise CommandError(f"Invalid action '{action}'")
+	return command(sid, username)
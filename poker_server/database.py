@@ -1,70 +1,143 @@
-import sqlite3, datetime, json, os
-
-DATABASE = os.getenv("DB_PATH")
-db = None
-
-def get_db():
-    global db
-    if db is None:
-        db = sqlite3.connect(DATABASE)
-        db.row_factory = sqlite3.Row
-    return db
-
-def query_db(query, args=(), one=False):
-    cur = get_db().execute(query, args)
-    rv = cur.fetchall()
-    cur.close()
-    return (rv[0] if rv else None) if one else rv
-
-def modify_db(cmd):
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute(cmd)
-    conn.commit()
-    conn.close()
-
-def get_chips(name):
-    row = query_db("SELECT * from chips WHERE username = ?", (name,), True)
-    if not row:
-        return "notfound"
-    return row["qty"]
-
-def get_last_replenished(name):
-    row = query_db("SELECT * from chips WHERE username = ?", (name,), True)
-    if not row:
-        return "notfound"
-    return row["last_replenished"]
-
-def replenish(name, qty):
-    row = query_db("SELECT * from chips WHERE username = ?", (name,), True)
-    if not row:
-        return "notfound"
-    date = datetime.datetime.utcnow().strftime("%d %B %Y %X")
-    with get_db() as con:
-        con.execute("UPDATE chips SET qty = ?, last_replenished = ? WHERE username = ?", (qty, date, name))
-    return "success"
-
-def join(name, chips):
-    prev_chips = query_db("SELECT * from chips WHERE username = ?", (name,), True)
-    if prev_chips is None:
-        modify_db(f"INSERT INTO chips VALUES ('{name}', 10000, '{datetime.datetime.utcnow().strftime('''%d %B %Y %X''')}');")
-        prev_chips = 10000
-    else:
-        prev_chips = int(prev_chips["qty"])
-    if prev_chips < chips:
-        print(f"NOT ENOUGH CHIPS for user {name}")
-        return "broke"
-    with get_db() as con:
-        con.execute("UPDATE chips SET qty = ? WHERE username = ?", (prev_chips - chips, name))
-    return "success"
-
-def leave(name, chips):
-    prev_chips = int(query_db("SELECT * from chips WHERE username = ?", (name,), True)["qty"])
-    with get_db() as con:
-        con.execute("UPDATE chips SET qty = ? WHERE username = ?", (chips + prev_chips, name))
-    return "success"
-
-def close_connection(exception):
-    global db
-    if db is not None:
-        db.close()
\ No newline at end of file
+import sqlite3, datetime, os, asyncio, threading
+import metrics
+from concurrent.futures import ThreadPoolExecutor
+
+DATABASE = os.getenv("DB_PATH")
+DB_READERS = int(os.getenv("DB_READERS", 4))
+STARTING_CHIPS = 10000
+
+# Fixed statement text so sqlite3's per-connection statement cache keeps them prepared.
+SELECT_ACCOUNT = "SELECT * from chips WHERE username = ?"
+CREATE_ACCOUNT = "INSERT INTO chips SELECT ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM chips WHERE username = ?)"
+BUY_IN = "UPDATE chips SET qty = qty - ? WHERE username = ? AND qty >= ?"
+CASH_OUT = "UPDATE chips SET qty = qty + ? WHERE username = ?"
+REPLENISH = "UPDATE chips SET qty = ?, last_replenished = ? WHERE username = ?"
+SEAT = "INSERT INTO seated VALUES (?, ?, ?)"
+UNSEAT = "DELETE FROM seated WHERE username = ? AND table_id = ?"
+
+def now():
+    return datetime.datetime.utcnow().strftime("%d %B %Y %X")
+
+class Ledger():
+    """All writes go through one writer thread with its own connection, reads
+    through a small pool. Every connection runs in WAL mode."""
+
+    def __init__(self, path=DATABASE, readers=DB_READERS):
+        self.path = path
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ledger-writer")
+        self.readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="ledger-reader")
+        self.local = threading.local()
+        self.connections = []
+
+    def connection(self):
+        con = getattr(self.local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            con.row_factory = sqlite3.Row
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            self.local.con = con
+            self.connections.append(con)
+        return con
+
+    def run(self, fn, args):
+        return fn(self.connection(), *args)
+
+    async def write(self, fn, *args):
+        with metrics.db_seconds.time(fn.__name__):
+            return await asyncio.get_event_loop().run_in_executor(self.writer, self.run, fn, args)
+
+    async def read(self, fn, *args):
+        with metrics.db_seconds.time(fn.__name__):
+            return await asyncio.get_event_loop().run_in_executor(self.readers, self.run, fn, args)
+
+    def close(self):
+        self.writer.shutdown()
+        self.readers.shutdown()
+        for con in self.connections:
+            con.close()
+        self.connections = []
+
+def transaction(con, statements):
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        cur = None
+        for query, args in statements:
+            cur = con.execute(query, args)
+        con.execute("COMMIT")
+        return cur
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+
+def _account(con, name):
+    return con.execute(SELECT_ACCOUNT, (name,)).fetchone()
+
+def _join(con, name, chips, table_id):
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        con.execute(CREATE_ACCOUNT, (name, STARTING_CHIPS, now(), name))
+        if not con.execute(BUY_IN, (chips, name, chips)).rowcount:
+            con.execute("ROLLBACK")
+            print(f"NOT ENOUGH CHIPS for user {name}")
+            return "broke"
+        if table_id is not None:
+            con.execute(SEAT, (name, table_id, chips))
+        con.execute("COMMIT")
+        return "success"
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+
+def _leave(con, name, chips, table_id):
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        if not con.execute(CASH_OUT, (chips, name)).rowcount:
+            con.execute("ROLLBACK")
+            return "notfound"
+        if table_id is not None:
+            con.execute(UNSEAT, (name, table_id))
+        con.execute("COMMIT")
+        return "success"
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+
+def _replenish(con, name, qty):
+    cur = transaction(con, [(REPLENISH, (qty, now(), name))])
+    return "success" if cur.rowcount else "notfound"
+
+ledger = None
+
+def get_ledger():
+    global ledger
+    if ledger is None:
+        ledger = Ledger()
+    return ledger
+
+async def get_chips(name):
+    row = await get_ledger().read(_account, name)
+    if not row:
+        return "notfound"
+    return row["qty"]
+
+async def get_last_replenished(name):
+    row = await get_ledger().read(_account, name)
+    if not row:
+        return "notfound"
+    return row["last_replenished"]
+
+async def replenish(name, qty):
+    return await get_ledger().write(_replenish, name, qty)
+
+async def join(name, chips, table_id=None):
+    return await get_ledger().write(_join, name, chips, table_id)
+
+async def leave(name, chips, table_id=None):
+    return await get_ledger().write(_leave, name, chips, table_id)
+
+def close_connection(exception=None):
+    global ledger
+    if ledger is not None:
+        ledger.close()
+        ledger = None
@@ -0,0 +1,23 @@
+def escape(key):
+	return str(key).replace("~", "~0").replace("/", "~1")
+
+def diff(old, new, path = ""):
+	"""JSON-patch style ops turning old into new. Dicts are walked key by key,
+	anything else that changed is replaced whole."""
+	if old is new:
+		return []
+	if isinstance(old, dict) and isinstance(new, dict):
+		ops = []
+		for key, value in new.items():
+			child = f"{path}/{escape(key)}"
+			if key not in old:
+				ops.append({"op": "add", "path": child, "value": value})
+			else:
+				ops.extend(diff(old[key], value, child))
+		for key in old:
+			if key not in new:
+				ops.append({"op": "remove", "path": f"{path}/{escape(key)}"})
+		return ops
+	if type(old) == type(new) and old == new:
+		return []
+	return [{"op": "replace", "path": path, "value": new}]
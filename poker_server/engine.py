@@ -0,0 +1,684 @@
+import os
+import json
+import time
+import asyncio
+import traceback
+from concurrent.futures import BrokenExecutor
+import timers
+import wire
+import metrics
+import evaluator
+import equity
+import pots
+import shuffle
+import history
+import database
+import commands
+from commands import CommandError
+import state
+from state import Table, Hand, Round, Turn, Seat
+from diff import diff
+
+DEFAULT_TABLE = "main"
+# seconds between streets of an all-in runout
+RUNOUT_DELAY = float(os.getenv("RUNOUT_DELAY", 1.5))
+
+class Poker():
+	# Off only to benchmark against one message per viewer.
+	spectator_tier = True
+	runout_delay = RUNOUT_DELAY
+
+	def __init__(self, loop, table_id = DEFAULT_TABLE, sio = None, seed = None, settlement = None, history = None, wheel = None, director = None, bots = None, lobby = None, play_money = False):
+		self.queue = asyncio.Queue()
+		self.table_id = table_id
+		self.sio = sio
+		self.shuffler = shuffle.ShuffleService(seed, background = False) if seed is not None else shuffle.get_service()
+		self.shuffle = None
+		self.settlement = settlement
+		self.history = history
+		self.director = director
+		self.bots = bots
+		self.lobby = lobby
+		# chips here never touch the ledger: buy-ins are free and nothing is settled
+		self.play_money = play_money
+		self.users = []
+		# equity and audit work running beside the actor
+		self.background = set()
+		self.cards = []
+		self.loop = loop
+		self.turn_time = 10
+		self.big_blind = 100
+		self.hands_played = 0
+		self.last_active = loop.time()
+		self.migrating = None
+		self.handoff = None
+		self.version = 0
+		self.public = None
+		self.views = {}
+		self.binary = set()
+		self.sids = {}
+		self.spectators = set()
+		self.spectator_view = None
+		self.sampled = 0
+		self.hand_start = {}
+		self.record = None
+		self.wheel = wheel or timers.get_wheel(loop)
+		self.deadline = None
+		self.turn_no = 0
+		self.hand_running = False
+		self.dirty = False
+		self.table = Table(self.big_blind, self.turn_time)
+		if lobby:
+			lobby.update(self)
+
+	def room(self, username = None):
+		return f"{self.table_id}/{username}" if username else self.table_id
+
+	def spectator_room(self, binary = False):
+		return f"{self.table_id}#spectators" + ("-binary" if binary else "")
+
+	def add_user(self, sid, username, binary = False):
+		self.unspectate(username)
+		self.users.append(username) if username not in self.users else 0
+		self.views.pop(username, None)
+		self.binary.add(username) if binary else self.binary.discard(username)
+		self.sids[username] = sid
+		self.sio.enter_room(sid, self.room())
+		self.sio.enter_room(sid, self.room(username))
+		self.last_active = self.loop.time()
+
+	def remove_user(self, sid, username):
+		self.unspectate(username)
+		self.sio.leave_room(sid, self.room())
+		self.sio.leave_room(sid, self.room(username))
+		self.users.remove(username) if username in self.users else 0
+		self.views.pop(username, None)
+		self.binary.discard(username)
+		self.sids.pop(username, None)
+		self.last_active = self.loop.time()
+
+	def spectate(self, username):
+		# Only after a full state has gone to the viewer alone, so every frame
+		# the spectator room then gets continues from what they have.
+		self.spectators.add(username)
+		self.sio.enter_room(self.sids[username], self.spectator_room(username in self.binary))
+
+	def unspectate(self, username):
+		if username in self.spectators:
+			self.spectators.discard(username)
+			self.sio.leave_room(self.sids[username], self.spectator_room(username in self.binary))
+		self.views.pop(username, None)
+
+	def is_idle(self, now, timeout):
+		return not self.users and not self.table.occupied() and now - self.last_active > timeout
+
+	def migrate(self, worker, handoff):
+		self.migrating = worker
+		self.handoff = handoff
+		self.submit(commands.Migrate())
+
+	def export(self):
+		seats = [[seat.username, seat.chips] if seat else None for seat in self.table.seats]
+		bots = [seat.username for seat in self.table.seats if seat and self.bots and self.bots.is_bot(seat.username)]
+		return {"seats": seats, "big_blind": self.table.big_blind, "button": self.table.button, "hands_played": self.hands_played,
+			"turn_time": self.turn_time, "play_money": self.play_money, "bots": bots}
+
+	def restore(self, snapshot):
+		self.table.seats = [Seat(*seat) if seat else None for seat in snapshot["seats"]]
+		self.table.big_blind = snapshot["big_blind"]
+		self.table.button = snapshot.get("button", self.table.button)
+		self.hands_played = snapshot["hands_played"]
+		self.turn_time = snapshot["turn_time"]
+		self.play_money = snapshot.get("play_money", False)
+		if self.bots:
+			for username in snapshot.get("bots", ()):
+				self.bots.adopt(username)
+		self.submit(commands.Start())
+
+	def snapshot(self):
+		# export() plus the hand in progress, enough to carry on mid-street.
+		# The deck is its seed and how many cards are left to deal.
+		table = self.table
+		snapshot = self.export()
+		snapshot["version"] = self.version
+		if self.hand_running:
+			snapshot["hand"] = {"hand": state.dump(table.hand), "round": state.dump(table.round), "turn": state.dump(table.turn),
+				"seed": self.shuffle.seed.hex(), "cards": len(self.cards), "hand_start": dict(self.hand_start), "record": state.dump(self.record)}
+		return snapshot
+
+	def resume(self, snapshot):
+		"""restore() from a snapshot; a hand in progress carries on with a
+		fresh turn clock for whoever is to act."""
+		table = self.table
+		self.restore(snapshot)
+		self.version = snapshot["version"]
+		progress = snapshot.get("hand")
+		if progress is None:
+			return
+		table.hand = state.load(Hand, progress["hand"])
+		table.round = state.load(Round, progress["round"])
+		table.turn = state.load(Turn, progress["turn"])
+		seed = bytes.fromhex(progress["seed"])
+		self.shuffle = shuffle.Shuffle(seed, shuffle.deal(seed))
+		self.cards = self.shuffle.cards()[:progress["cards"]]
+		self.hand_start = progress["hand_start"]
+		self.record = state.load(history.HandRecord, progress["record"])
+		self.hand_running = True
+		if table.round.over:
+			self.submit(commands.Advance())
+		else:
+			self.arm_turn()
+
+	def open_seat(self, seat):
+		# a seat left mid-hand still holds its hole cards and contributions
+		# until the hand ends
+		return self.table.seats[seat] is None and not (self.hand_running and self.table.hand.dealt >> seat & 1)
+
+	def sit(self, username, seat, amount):
+		self.table.seats[seat] = Seat(username, amount)
+
+	def full_view(self, private):
+		state = dict(self.public)
+		state["hand"] = dict(self.public["hand"], **private)
+		state["seq"] = self.version
+		return state
+
+	def resync(self, username):
+		self.unspectate(username)
+
+	async def notify_state(self, msg = "", reveal = False):
+		# Redacted public view is built once per version. Seated viewers that saw
+		# the previous version get a patch: public ops plus their own overlay
+		# ops. Everyone else shares one spectator message per version, the same
+		# 'state'/'patch' dict seated viewers get, encoded once and that packet
+		# sent to the whole spectator room. Binary viewers get the packed public
+		# section plus their own.
+		table = self.table
+		reveal = reveal or table.runout()
+		public = table.public_wire()
+		public["message"] = msg
+		public_ops = diff(self.public, public) if self.public is not None else None
+		self.public = public
+		self.version += 1
+		encoded = wire.encode_public(table, self.version, msg) if self.binary else None
+		spectator = table.private_wire(None, reveal)
+		seen = self.spectator_view
+		self.spectator_view = (self.version, spectator)
+		joining = []
+		for username in self.users:
+			if username in self.spectators:
+				continue
+			seated = table.seat_of(username) is not None
+			if self.spectator_tier and not seated:
+				joining.append(username)
+			if username in self.binary:
+				message = encoded + wire.encode_private(table, username if seated else None, reveal)
+				self.count_message('bstate', message)
+				await self.sio.emit('bstate', message, to=self.room(username))
+				continue
+			private = table.private_wire(username, reveal) if seated or not self.spectator_tier else spectator
+			last = self.views.get(username)
+			self.views[username] = (self.version, private)
+			if public_ops is None or not last or last[0] != self.version - 1:
+				message = self.full_view(private)
+				self.count_message('state', message)
+				await self.sio.emit('state', message, to=self.room(username))
+				continue
+			ops = public_ops + diff(last[1], private, "/hand")
+			message = {"seq": self.version, "ops": ops}
+			self.count_message('patch', message)
+			await self.sio.emit('patch', message, to=self.room(username))
+		if len(self.spectators) > len(self.binary & self.spectators):
+			if public_ops is None or not seen or seen[0] != self.version - 1:
+				event, message = 'state', self.full_view(spectator)
+			else:
+				event, message = 'patch', {"seq": self.version, "ops": public_ops + diff(seen[1], spectator, "/hand")}
+			self.count_message(event, message)
+			await self.sio.emit_shared(event, message, to=self.spectator_room())
+		if self.binary & self.spectators:
+			message = encoded + wire.encode_private(table, None, reveal)
+			self.count_message('bstate', message)
+			await self.sio.emit_shared('bstate', message, to=self.spectator_room(True))
+		for username in joining:
+			self.spectate(username)
+		metrics.notify_fanout.observe(len(self.users))
+
+	def count_message(self, kind, message):
+		metrics.broadcast_messages.inc(kind)
+		if isinstance(message, (bytes, str)):
+			metrics.broadcast_bytes.observe(len(message), kind)
+			return
+		self.sampled += 1
+		if self.sampled >= metrics.METRICS_BYTES_SAMPLE:
+			self.sampled = 0
+			metrics.broadcast_bytes.observe(len(json.dumps(message)), kind)
+
+	def arm_turn(self):
+		# One wheel deadline per turn. A move cancels it; if it fires first the
+		# timeout is queued with the turn number so a stale one is ignored.
+		table = self.table
+		self.disarm_turn()
+		self.turn_no += 1
+		table.turn.deadline = round(time.time() + self.turn_time, 3)
+		self.deadline = self.wheel.schedule(self.turn_time, self.submit, commands.Timeout(self.turn_no))
+		if self.bots:
+			self.bots.turn(self)
+
+	def disarm_turn(self):
+		if self.deadline:
+			self.deadline.cancel()
+			self.deadline = None
+
+	def new_hand(self):
+		table = self.table
+		dealt = table.stacked()
+		table.button = state.next_seat(dealt, table.button)
+		positions = state.ring(dealt, table.button)
+		if len(positions) == 2:
+			# heads up the button posts the small blind and acts first preflop
+			positions.reverse()
+
+		table.hand = Hand(positions)
+		table.round = Round("preflop")
+		table.turn = Turn(self.turn_time)
+
+		self.shuffle = self.shuffler.draw()
+		self.cards = self.shuffle.cards()
+		self.hands_played += 1
+		metrics.hands.inc()
+
+		self.hand_start = {table.seats[seat].username: table.seats[seat].chips for seat in positions}
+		self.record = history.HandRecord(self.table_id, self.hands_played, table.big_blind,
+			[(seat, table.seats[seat].username, table.seats[seat].chips) for seat in positions], list(positions), list(self.shuffle.deck))
+		small_blind = table.big_blind // 2
+		for i, action in enumerate(("smallblind", "bigblind")):
+			blind = min(small_blind * (i + 1), table.seats[positions[i]].chips)
+			self.put_in(positions[i], blind)
+			table.round.last_action[positions[i]] = action
+			self.record.action(positions[i], action, blind)
+
+		table.turn.bet_size = max(table.round.chips_out)
+		self.find_actor(positions[1])
+		# as on later streets the round closes when the turn comes back round
+		# to the first to act, so the big blind gets its option
+		table.round.last_bet_player = table.turn.action_player
+
+		for seat in positions:
+			table.hand.hole_cards[seat] = [self.cards.pop() for x in range(2)]
+
+	def find_hands(self):
+		hand = self.table.hand
+		with metrics.engine_seconds.time("find_hands"):
+			community = evaluator.to_indices(hand.community_cards)
+			for seat in hand.starting_positions:
+				hand.hands[seat] = evaluator.evaluate(community + evaluator.to_indices(hand.hole_cards[seat]))
+
+	async def find_equity(self):
+		hand = self.table.hand
+		players = list(hand.positions)
+		board = list(hand.community_cards)
+		if len(players) < 2:
+			return
+		try:
+			result = await equity.calculate([hand.hole_cards[seat] for seat in players], board)
+		except RuntimeError as e:
+			# the pool is shut down or broken; the hand goes on without equities
+			if isinstance(e, BrokenExecutor):
+				print(f"{self.table_id}: equity pool broken: {e!r}")
+			return
+		self.submit(commands.Equity(hand, board, dict(zip(players, result["equity"]))))
+
+	def spawn(self, coro):
+		task = self.loop.create_task(coro)
+		self.background.add(task)
+		task.add_done_callback(self.reaped)
+		return task
+
+	def reaped(self, task):
+		self.background.discard(task)
+		error = None if task.cancelled() else task.exception()
+		if error is not None:
+			print(f"{self.table_id}: {task.get_coro().__name__} failed")
+			traceback.print_exception(type(error), error, error.__traceback__)
+
+	def find_winner(self):
+		hand = self.table.hand
+		with metrics.engine_seconds.time("find_winner"):
+			contributed = {seat: hand.contributed[seat] for seat in hand.starting_positions}
+			for seat, chips in pots.settle(contributed, hand.positions, hand.hands, hand.starting_positions).items():
+				self.table.seats[seat].chips += chips
+			hand.pot = 0
+
+	def log_hand(self):
+		hand = self.table.hand
+		self.record.board = evaluator.to_indices(hand.community_cards)
+		self.record.result = [(seat, self.table.seats[seat].chips, hand.hands[seat]) for seat in hand.starting_positions if self.table.seats[seat]]
+		self.history.append(self.record)
+		self.record = None
+
+	async def settle(self):
+		if self.record and self.history is not None:
+			self.log_hand()
+		self.record = None
+		deltas = {seat.username: seat.chips - self.hand_start[seat.username] for seat in self.table.seats
+			if seat and seat.username in self.hand_start}
+		if self.settlement and not self.play_money:
+			await self.settlement.record(self.table_id, deltas)
+
+	async def audit(self, reveal_seed = False):
+		# The deck's commitment goes out when the hand is dealt and its seed
+		# once the hand is over; shuffle.verify checks one against the other.
+		message = {"hand": self.hands_played, "commitment": self.shuffle.commitment}
+		if reveal_seed:
+			message["seed"] = self.shuffle.seed.hex()
+		await self.sio.emit('audit', message, to=self.room())
+
+	def submit(self, command):
+		self.queue.put_nowait(command)
+
+	async def main(self):
+		# The only writer of table state. Whatever has queued up since the last
+		# pass is applied in order, then replies go out and one broadcast
+		# covers the whole batch.
+		while True:
+			batch = [await self.queue.get()]
+			while not self.queue.empty():
+				batch.append(self.queue.get_nowait())
+			self.dirty = False
+			replies = []
+			for command in batch:
+				try:
+					reply = await self.apply(command)
+				except CommandError as e:
+					reply = {"error": str(e)}
+				except Exception:
+					# one bad command must not take the table down with it
+					print(f"{self.table_id}: {command.action} by {command.username} failed")
+					traceback.print_exc()
+					metrics.command_failures.inc(command.action)
+					reply = {"error": "something went wrong"}
+					self.dirty = True
+				if reply and command.sid is not None:
+					replies.append((reply, command.sid))
+			for reply, sid in replies:
+				await self.sio.send(reply, sid)
+			if self.dirty:
+				await self.notify_state()
+				if self.lobby:
+					self.lobby.update(self)
+				done = time.perf_counter()
+				for command in batch:
+					if command.username is not None:
+						metrics.action_latency.observe(done - command.at, command.action)
+			if self.migrating is not None and not self.hand_running:
+				return await self.handoff(self)
+
+	async def apply(self, command):
+		handler = getattr(self, "do_" + command.action)
+		return await handler(command)
+
+	async def do_start(self, command):
+		self.start_hand()
+
+	async def do_migrate(self, command):
+		pass
+
+	async def do_advance(self, command):
+		if command.hand is None:
+			await self.advance()
+		elif command.hand is self.table.hand and self.hand_running:
+			await self.advance(paced = True)
+
+	async def do_equity(self, command):
+		hand = command.hand
+		if self.table.hand is not hand or hand.community_cards != command.board:
+			return
+		for seat, share in command.shares.items():
+			hand.equity[seat] = share
+		self.dirty = True
+
+	def start_hand(self):
+		if self.hand_running or self.migrating is not None:
+			return
+		if self.bots and self.bots.refill(self):
+			self.dirty = True
+		if state.COUNT[self.table.stacked()] < 2:
+			return
+		self.new_hand()
+		self.spawn(self.audit())
+		self.hand_running = True
+		if self.table.round.over:
+			# all in from the blinds; the board is run out without a turn
+			self.submit(commands.Advance())
+		else:
+			self.arm_turn()
+		self.dirty = True
+
+	async def end_hand(self, reveal):
+		self.disarm_turn()
+		self.hand_running = False
+		await self.settle()
+		await self.audit(reveal_seed = True)
+		if reveal:
+			await self.notify_state(reveal = True)
+		if self.director:
+			await self.director.hand_ended(self)
+		if self.lobby:
+			self.lobby.hand_ended(self, sum(self.table.hand.contributed))
+		self.start_hand()
+		self.dirty = True
+
+	async def advance(self, paced = False):
+		# Called after every move or timeout: deal the next street once the
+		# betting round is over, finish the hand, or hand the turn on. In an
+		# all-in runout the cards are shown with live equity and each street
+		# waits runout_delay, paced in by an Advance for the hand.
+		table = self.table
+		hand, rnd, turn = table.hand, table.round, table.turn
+		self.dirty = True
+		if rnd.over:
+			if not paced and table.runout():
+				if self.users:
+					self.spawn(self.find_equity())
+				return self.pace_runout()
+			street = rnd.street
+			for seat in hand.starting_positions:
+				hand.pot += rnd.chips_out[seat]
+				hand.contributed[seat] += rnd.chips_out[seat]
+			table.round = rnd = Round(street)
+			turn.bet_size = 0
+			if state.COUNT[hand.live] == 1:
+				table.seats[state.next_seat(hand.live, 0)].chips += hand.pot
+				hand.pot = 0
+				return await self.end_hand(reveal = False)
+			if street == "river":
+				self.find_winner()
+				return await self.end_hand(reveal = True)
+			hand.community_cards.extend(self.cards.pop() for x in range(3 if street == "preflop" else 1))
+			rnd.street = {"preflop": "flop", "flop": "turn", "turn": "river"}[street]
+			self.find_hands()
+			self.find_actor(table.button)
+			rnd.last_bet_player = turn.action_player
+			if rnd.over:
+				return await self.advance()
+		self.arm_turn()
+
+	def pace_runout(self):
+		self.disarm_turn()
+		command = commands.Advance(self.table.hand)
+		if self.runout_delay:
+			self.deadline = self.wheel.schedule(self.runout_delay, self.submit, command)
+		else:
+			self.submit(command)
+
+	def is_turn(self, seat):
+		return self.hand_running and not self.table.round.over and seat is not None and seat == self.table.turn.action_player
+
+	async def on_json(self, sid, username, data):
+		self.last_active = self.loop.time()
+		try:
+			self.submit(commands.parse(sid, username, data))
+		except CommandError as e:
+			await self.sio.send({"error": str(e)}, sid)
+
+	async def do_join(self, command):
+		table = self.table
+		if self.director is not None:
+			raise CommandError("tournament seats are assigned by the director")
+		if table.seat_of(command.username) is not None:
+			raise CommandError("already joined")
+		if table.seats[command.seat]:
+			raise CommandError("seat taken")
+		if not self.open_seat(command.seat):
+			raise CommandError("seat free after this hand")
+		if not self.play_money and await database.join(command.username, command.amount, self.table_id) != "success":
+			raise CommandError("something went wrong")
+		self.sit(command.username, command.seat, command.amount)
+		self.unspectate(command.username)
+		self.start_hand()
+		return {"success": True}
+
+	async def do_leave(self, command):
+		table = self.table
+		if self.director is not None:
+			# the stack belongs to the event until the player busts or wins
+			raise CommandError("can't leave a tournament table")
+		seat = table.seat_of(command.username)
+		if seat is None:
+			raise CommandError("not at table")
+		if self.hand_running and table.hand.live >> seat & 1:
+			raise CommandError("still in the hand")
+		chips = table.seats[seat].chips
+		if not self.play_money:
+			if self.settlement:
+				await self.settlement.flush()
+			if await database.leave(command.username, chips, self.table_id) != "success":
+				raise CommandError("something went wrong")
+		table.seats[seat] = None
+		self.views.pop(command.username, None)
+		self.start_hand()
+		self.dirty = True
+		return {"success": True}
+
+	async def do_arrive(self, command):
+		# a tournament player moved here from another table
+		seat = next(seat for seat in range(state.SEATS) if self.open_seat(seat))
+		self.sit(command.username, seat, command.chips)
+		self.unspectate(command.username)
+		self.start_hand()
+		self.dirty = True
+
+	async def do_state(self, command):
+		self.resync(command.username)
+		self.dirty = True
+
+	def turn_seat(self, command):
+		seat = self.table.seat_of(command.username)
+		if not self.is_turn(seat):
+			raise CommandError("Not your turn")
+		return seat
+
+	def put_in(self, seat, chips):
+		table = self.table
+		table.seats[seat].chips -= chips
+		table.round.chips_out[seat] += chips
+		if table.seats[seat].chips == 0:
+			table.hand.all_in |= 1 << seat
+
+	def next_actor(self, seat):
+		# The next seat after seat that can still bet, or None when the turn
+		# would reach or pass the last bettor: the betting round is over.
+		rnd = self.table.round
+		after = state.next_seat(self.table.hand.able, seat)
+		if after < 0 or state.distance(seat, after) >= state.distance(seat, rnd.last_bet_player):
+			return None
+		return after
+
+	def find_actor(self, after):
+		# Turn to the first seat after after that can still bet, or the round
+		# is over when nobody is left who could bet or owes a call.
+		table = self.table
+		hand, rnd, turn = table.hand, table.round, table.turn
+		able = hand.able
+		if not able or state.COUNT[able] == 1 and rnd.chips_out[state.next_seat(able, 0)] >= turn.bet_size:
+			rnd.over = 1
+			return
+		turn.action_player = state.next_seat(able, after)
+
+	def pass_turn(self, seat):
+		rnd, turn = self.table.round, self.table.turn
+		after = self.next_actor(seat)
+		if after is None:
+			rnd.over = 1
+		else:
+			turn.action_player = after
+
+	async def do_check(self, command):
+		table = self.table
+		rnd, turn = table.round, table.turn
+		seat = self.turn_seat(command)
+		if turn.bet_size > rnd.chips_out[seat]:
+			raise CommandError("Invalid action 'check'")
+		rnd.last_action[seat] = "check"
+		self.record.action(seat, "check")
+		self.pass_turn(seat)
+		await self.advance()
+
+	async def do_call(self, command):
+		table = self.table
+		rnd, turn = table.round, table.turn
+		seat = self.turn_seat(command)
+		if turn.bet_size <= rnd.chips_out[seat]:
+			raise CommandError("Invalid action 'call'")
+		# short of the full call is all in for what is left
+		chips_needed = min(turn.bet_size - rnd.chips_out[seat], table.seats[seat].chips)
+		rnd.last_action[seat] = "call"
+		self.record.action(seat, "call", chips_needed)
+		self.put_in(seat, chips_needed)
+		self.pass_turn(seat)
+		await self.advance()
+
+	async def do_raise(self, command):
+		table = self.table
+		rnd, turn = table.round, table.turn
+		seat = self.turn_seat(command)
+		amount = command.amount
+		if turn.bet_size >= amount:
+			raise CommandError("Invalid raise amount 'raise'")
+		chips_needed = amount - rnd.chips_out[seat]
+		if table.seats[seat].chips < chips_needed:
+			raise CommandError("Not enough chips")
+		rnd.last_action[seat] = "raise"
+		self.record.action(seat, "raise", chips_needed)
+		self.put_in(seat, chips_needed)
+		turn.bet_size = amount
+		rnd.last_bet_player = seat
+		after = self.next_actor(seat)
+		if after is None:
+			rnd.over = 1
+		else:
+			turn.action_player = after
+		await self.advance()
+
+	async def do_fold(self, command):
+		seat = self.turn_seat(command)
+		self.fold(seat, "fold")
+		await self.advance()
+
+	async def do_timeout(self, command):
+		if command.turn_no != self.turn_no or self.deadline is None:
+			return
+		self.deadline = None
+		self.fold(self.table.turn.action_player, "timeout")
+		await self.advance()
+
+	def fold(self, seat, action):
+		hand, rnd, turn = self.table.hand, self.table.round, self.table.turn
+		rnd.last_action[seat] = "fold"
+		self.record.action(seat, action)
+		hand.folded |= 1 << seat
+		after = self.next_actor(seat)
+		if after is None or state.COUNT[hand.live] == 1:
+			rnd.over = 1
+		else:
+			turn.action_player = after
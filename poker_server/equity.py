@@ -0,0 +1,74 @@
+import os
+import math
+import time
+import asyncio
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import evaluator
+
+EQUITY_SAMPLES = int(os.getenv("EQUITY_SAMPLES", 20000))
+EQUITY_BUDGET = float(os.getenv("EQUITY_BUDGET", 0.25))
+EQUITY_WORKERS = int(os.getenv("EQUITY_WORKERS", 2))
+BATCH_SIZE = 2048
+
+FLUSH_TABLE = np.array(evaluator.FLUSH_RANK, dtype=np.int64)
+PRODUCT_KEYS = np.array(sorted(evaluator.PRODUCT_RANK), dtype=np.int64)
+PRODUCT_VALUES = np.array([evaluator.PRODUCT_RANK[k] for k in PRODUCT_KEYS.tolist()], dtype=np.int64)
+CARD_PRIMES = np.array(evaluator.CARD_PRIMES, dtype=np.int64)
+CARD_BITS = np.array(evaluator.CARD_BITS, dtype=np.int64)
+
+executor = None
+
+def evaluate_batch(cards):
+	# cards is an (n, 7) int array; same tables as evaluator.evaluate, one row per hand
+	products = CARD_PRIMES[cards].prod(axis=1)
+	ranks = PRODUCT_VALUES[np.searchsorted(PRODUCT_KEYS, products)]
+	suits = cards & 3
+	bits = CARD_BITS[cards]
+	for suit in range(4):
+		flush = FLUSH_TABLE[np.where(suits == suit, bits, 0).sum(axis=1)]
+		ranks = np.where(flush > 0, flush, ranks)
+	return ranks
+
+def _score(holes, boards):
+	ranks = np.stack([evaluate_batch(np.concatenate([np.broadcast_to(hole, (len(boards), 2)), boards], axis=1)) for hole in holes], axis=1)
+	winners = ranks == ranks.max(axis=1)[:, None]
+	return (winners / winners.sum(axis=1)[:, None]).sum(axis=0)
+
+def equity(hole_cards, board, samples = EQUITY_SAMPLES, budget = EQUITY_BUDGET, seed = None):
+	deadline = time.monotonic() + budget
+	holes = np.array(hole_cards, dtype=np.int64)
+	board = np.array(board, dtype=np.int64)
+	used = set(holes.ravel().tolist()) | set(board.tolist())
+	deck = np.array([c for c in range(52) if c not in used], dtype=np.int64)
+	missing = 5 - len(board)
+	wins = np.zeros(len(holes))
+	boards_seen = 0
+	if math.comb(len(deck), missing) <= samples:
+		runouts = np.array(list(itertools.combinations(deck.tolist(), missing)), dtype=np.int64)
+		for start in range(0, len(runouts), BATCH_SIZE):
+			chunk = runouts[start:start + BATCH_SIZE]
+			wins += _score(holes, np.concatenate([np.broadcast_to(board, (len(chunk), len(board))), chunk], axis=1))
+			boards_seen += len(chunk)
+		exhaustive = True
+	else:
+		rng = np.random.default_rng(seed)
+		while boards_seen < samples and time.monotonic() < deadline:
+			size = min(BATCH_SIZE, samples - boards_seen)
+			chunk = deck[rng.random((size, len(deck))).argsort(axis=1)[:, :missing]]
+			wins += _score(holes, np.concatenate([np.broadcast_to(board, (size, len(board))), chunk], axis=1))
+			boards_seen += size
+		exhaustive = False
+	return {"equity": (wins / max(boards_seen, 1)).tolist(), "boards": boards_seen, "exhaustive": exhaustive}
+
+def get_executor():
+	global executor
+	if executor is None:
+		executor = ProcessPoolExecutor(max_workers=EQUITY_WORKERS)
+	return executor
+
+async def calculate(hole_cards, board, samples = EQUITY_SAMPLES, budget = EQUITY_BUDGET):
+	loop = asyncio.get_event_loop()
+	hole_cards = [evaluator.to_indices(cards) for cards in hole_cards]
+	return await loop.run_in_executor(get_executor(), equity, hole_cards, evaluator.to_indices(board), samples, budget)
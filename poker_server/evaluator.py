@@ -0,0 +1,217 @@
+import os
+import pickle
+import itertools
+from collections import namedtuple
+
+TABLES_CACHE = os.getenv("EVALUATOR_CACHE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "__pycache__", "evaluator-tables.pickle"))
+
+RANKS = "23456789TJQKA"
+SUITS = "SHCD"
+PRIMES = [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41]
+
+HAND_NAMES = [
+	'High card',
+	'One pair',
+	'Two pair',
+	'Three of a kind',
+	'Straight',
+	'Flush',
+	'Full house',
+	'Four of a kind',
+	'Straight flush',
+	'Royal flush',
+]
+
+# Cards are ints 0..51: rank index * 4 + suit index. A hand rank is a single int,
+# category << 20 followed by five 4-bit kickers, so bigger is always better.
+CARD_INDEX = {rank + suit: r * 4 + s for r, rank in enumerate(RANKS) for s, suit in enumerate(SUITS)}
+CARD_NAMES = [rank + suit for rank in RANKS for suit in SUITS]
+CARD_PRIMES = [PRIMES[c >> 2] for c in range(52)]
+CARD_BITS = [1 << (c >> 2) for c in range(52)]
+
+def pack(category, kickers):
+	rank = category
+	for k in (list(kickers) + [0] * 5)[:5]:
+		rank = (rank << 4) | k
+	return rank
+
+def category(rank):
+	return rank >> 20
+
+def hand_name(rank):
+	return HAND_NAMES[rank >> 20]
+
+def kickers(rank):
+	return [(rank >> shift) & 0xF for shift in (16, 12, 8, 4, 0)]
+
+def describe(rank):
+	return (hand_name(rank), kickers(rank))
+
+def _straight_high(mask):
+	for high in range(12, 3, -1):
+		if mask >> (high - 4) & 0x1F == 0x1F:
+			return high + 2
+	if mask & 0x100F == 0x100F:
+		return 5
+	return 0
+
+def _top(mask, n):
+	out = []
+	for r in range(12, -1, -1):
+		if mask >> r & 1:
+			out.append(r + 2)
+			if len(out) == n:
+				break
+	return out
+
+STRAIGHT_HIGH = [_straight_high(mask) for mask in range(1 << 13)]
+
+def _flush_rank(mask):
+	if bin(mask).count("1") < 5:
+		return 0
+	high = STRAIGHT_HIGH[mask]
+	if high == 14:
+		return pack(9, [14])
+	if high:
+		return pack(8, [high])
+	return pack(5, _top(mask, 5))
+
+def _multiset_rank(ranks):
+	counts = [0] * 13
+	for r in ranks:
+		counts[r] += 1
+	mask = 0
+	for r in ranks:
+		mask |= 1 << r
+	by_count = {}
+	for r in range(12, -1, -1):
+		if counts[r]:
+			by_count.setdefault(counts[r], []).append(r + 2)
+	quads, trips, pairs, singles = (by_count.get(n, []) for n in (4, 3, 2, 1))
+	if quads:
+		rest = sorted(trips + pairs + singles + quads[1:], reverse=True)
+		return pack(7, [quads[0]] + rest[:1])
+	if trips and (len(trips) > 1 or pairs):
+		return pack(6, [trips[0], max(trips[1:] + pairs)])
+	high = STRAIGHT_HIGH[mask]
+	if high:
+		return pack(4, [high])
+	if trips:
+		return pack(3, [trips[0]] + singles[:2])
+	if len(pairs) > 1:
+		return pack(2, pairs[:2] + sorted(pairs[2:] + singles, reverse=True)[:1])
+	if pairs:
+		return pack(1, pairs[:1] + singles[:3])
+	return pack(0, singles[:5])
+
+def _product_ranks():
+	# Prime-product perfect hash: every multiset of 5-7 ranks (no rank more
+	# than four times) maps to the best non-flush rank it can make.
+	table = {}
+	for n in (5, 6, 7):
+		for ranks in itertools.combinations_with_replacement(range(13), n):
+			if any(ranks.count(r) > 4 for r in set(ranks)):
+				continue
+			product = 1
+			for r in ranks:
+				product *= PRIMES[r]
+			table[product] = _multiset_rank(ranks)
+	return table
+
+def _load_tables(path = TABLES_CACHE):
+	# Building the tables takes most of a second, which every process that
+	# imports this (server workers, equity workers) would pay. They are kept
+	# in a pickle keyed by this file's mtime and rebuilt when it changes.
+	stamp = os.stat(__file__).st_mtime_ns
+	try:
+		with open(path, "rb") as f:
+			cached = pickle.load(f)
+		if cached[0] == stamp:
+			return cached[1], cached[2]
+	except (OSError, EOFError, pickle.UnpicklingError, IndexError, TypeError):
+		pass
+	flush = [_flush_rank(mask) for mask in range(1 << 13)]
+	product = _product_ranks()
+	try:
+		os.makedirs(os.path.dirname(path), exist_ok = True)
+		tmp = f"{path}.{os.getpid()}"
+		with open(tmp, "wb") as f:
+			pickle.dump((stamp, flush, product), f, pickle.HIGHEST_PROTOCOL)
+		os.replace(tmp, path)
+	except OSError:
+		pass
+	return flush, product
+
+FLUSH_RANK, PRODUCT_RANK = _load_tables()
+
+def evaluate(cards):
+	masks = [0, 0, 0, 0]
+	product = 1
+	for c in cards:
+		masks[c & 3] |= CARD_BITS[c]
+		product *= CARD_PRIMES[c]
+	for mask in masks:
+		flush = FLUSH_RANK[mask]
+		if flush:
+			return flush
+	return PRODUCT_RANK[product]
+
+def to_indices(cards):
+	return [CARD_INDEX[card] for card in cards]
+
+def evaluate_strs(cards):
+	return evaluate([CARD_INDEX[card] for card in cards])
+
+# Reference implementation the lookup tables were checked against.
+
+def all_equal(lst):
+	return len(set(lst)) == 1
+
+def is_consecutive(lst):
+	return len(set(lst)) == len(lst) and max(lst) - min(lst) == len(lst) - 1
+
+class Card(namedtuple('Card', 'numeric_rank rank suit')):
+	def __str__(self):
+		return self.rank + self.suit
+
+def parse_card(card):
+	FACE_VALUES = {'A': 14, 'J': 11, 'Q': 12, 'K': 13, "T":10}
+	rank, suit = card[:-1], card[-1:]
+	return Card(
+		numeric_rank=int(FACE_VALUES.get(rank, rank)),
+		rank=rank,
+		suit=suit
+	)
+
+def parse_cards(cards):
+	return [parse_card(card) for card in cards]
+
+def encode_hand(hand):
+	typ = HAND_NAMES.index(hand[0])
+	return f"{typ:#X}" + "".join([f"{x:X}" for x in hand[1]])
+
+def evaluate_hand(cards):
+	ranks = [card.numeric_rank for card in cards]
+	suits = [card.suit for card in cards]
+	if is_consecutive(ranks):
+		return (
+			('Straight', [max(ranks), *([0] * 4)]) if not all_equal(suits) else
+			('Straight flush', [max(ranks), *([0] * 4)]) if max(ranks) < 14 else
+			('Royal flush', [14, *([0] * 4)])
+		)
+	wheel = [x if x != 14 else 1 for x in ranks]
+	if is_consecutive(wheel):
+		return (
+			('Straight', [5, *([0] * 4)]) if not all_equal(suits) else
+			('Straight flush', [5, *([0] * 4)])
+		)
+	if all_equal(suits):
+		return ('Flush', sorted(ranks, reverse = True))
+	return {
+		4 + 4 + 4 + 4 + 1: ('Four of a kind', [max(set(ranks), key=ranks.count), *([0] * 4)]),
+		3 + 3 + 3 + 2 + 2: ('Full house',[max(set(ranks), key=ranks.count), min(set(ranks), key=ranks.count), *([0] * 3)]),
+		3 + 3 + 3 + 1 + 1: ('Three of a kind',[max(set(ranks), key=ranks.count), *sorted(set(ranks), key=ranks.count)[:-1], *([0] * 2)]),
+		2 + 2 + 2 + 2 + 1: ('Two pair',[*sorted(sorted(set(ranks), key=ranks.count)[1:], reverse = True), min(set(ranks), key=ranks.count), *([0] * 2)]),
+		2 + 2 + 1 + 1 + 1: ('One pair',[max(set(ranks), key=ranks.count), *sorted(sorted(set(ranks), key=ranks.count)[:-1], reverse = True), *([0] * 1)]),
+		1 + 1 + 1 + 1 + 1: ('High card', sorted(ranks, reverse = True)),
+	}[sum(ranks.count(r) for r in ranks)]
@@ -0,0 +1,294 @@
+import os
+import json
+import mmap
+import time
+import struct
+import asyncio
+import evaluator
+import shuffle
+from state import SEATS
+
+HISTORY_DIR = os.getenv("HISTORY_DIR", "history")
+HISTORY_SEGMENT_BYTES = int(os.getenv("HISTORY_SEGMENT_BYTES", 64 * 1024 * 1024))
+VERSION = 1
+
+ACTIONS = ["smallblind", "bigblind", "check", "call", "raise", "fold", "timeout"]
+ACTION_CODES = {action: code for code, action in enumerate(ACTIONS)}
+
+LENGTH = struct.Struct("<I")
+HEADER = struct.Struct("<BdIq")
+SEAT = struct.Struct("<Bq")
+ACTION = struct.Struct("<fBBq")
+RESULT = struct.Struct("<BqI")
+
+class HandRecord():
+	"""One completed hand. Cards are stored as evaluator indices and the full
+	shuffled deck is kept, so the hand can be dealt again exactly."""
+	__slots__ = ("table_id", "hand_no", "started", "big_blind", "seats", "positions", "deck", "actions", "board", "result")
+
+	def __init__(self, table_id, hand_no, big_blind, seats, positions, deck, started = None):
+		self.table_id = table_id
+		self.hand_no = hand_no
+		self.started = started if started is not None else time.time()
+		self.big_blind = big_blind
+		self.seats = seats
+		self.positions = positions
+		self.deck = deck
+		self.actions = []
+		self.board = []
+		self.result = []
+
+	def action(self, seat, action, amount = 0, at = None):
+		# amount is the chips the action put in, not the size it raised to
+		at = at if at is not None else time.time()
+		self.actions.append((at - self.started, seat, ACTION_CODES[action], int(amount)))
+
+	def players(self):
+		return [name for seat, name, stack in self.seats]
+
+def _pack_str(value):
+	data = value.encode()
+	return struct.pack("<H", len(data)) + data
+
+def _unpack_str(buf, offset):
+	size = struct.unpack_from("<H", buf, offset)[0]
+	offset += 2
+	return bytes(buf[offset:offset + size]).decode(), offset + size
+
+def encode(record):
+	parts = [HEADER.pack(VERSION, record.started, record.hand_no, record.big_blind), _pack_str(record.table_id)]
+	parts.append(bytes([len(record.seats)]))
+	for seat, name, stack in record.seats:
+		parts.append(SEAT.pack(seat, stack) + _pack_str(name))
+	parts.append(bytes([len(record.positions)]) + bytes(record.positions))
+	parts.append(bytes([len(record.deck)]) + bytes(record.deck))
+	parts.append(struct.pack("<H", len(record.actions)))
+	parts.extend(ACTION.pack(*action) for action in record.actions)
+	parts.append(bytes([len(record.board)]) + bytes(record.board))
+	parts.append(bytes([len(record.result)]))
+	parts.extend(RESULT.pack(*result) for result in record.result)
+	payload = b"".join(parts)
+	return LENGTH.pack(len(payload)) + payload
+
+def decode(buf, offset = 0):
+	size = LENGTH.unpack_from(buf, offset)[0]
+	offset += LENGTH.size
+	end = offset + size
+	version, started, hand_no, big_blind = HEADER.unpack_from(buf, offset)
+	offset += HEADER.size
+	table_id, offset = _unpack_str(buf, offset)
+	count = buf[offset]
+	offset += 1
+	seats = []
+	for _ in range(count):
+		seat, stack = SEAT.unpack_from(buf, offset)
+		name, offset = _unpack_str(buf, offset + SEAT.size)
+		seats.append((seat, name, stack))
+	count = buf[offset]
+	positions = list(buf[offset + 1:offset + 1 + count])
+	offset += 1 + count
+	count = buf[offset]
+	deck = list(buf[offset + 1:offset + 1 + count])
+	offset += 1 + count
+	record = HandRecord(table_id, hand_no, big_blind, seats, positions, deck, started)
+	count = struct.unpack_from("<H", buf, offset)[0]
+	offset += 2
+	for _ in range(count):
+		record.actions.append(ACTION.unpack_from(buf, offset))
+		offset += ACTION.size
+	count = buf[offset]
+	record.board = list(buf[offset + 1:offset + 1 + count])
+	offset += 1 + count
+	count = buf[offset]
+	offset += 1
+	for _ in range(count):
+		record.result.append(RESULT.unpack_from(buf, offset))
+		offset += RESULT.size
+	assert offset == end, "corrupt hand record"
+	return record, end
+
+class HandLog():
+	"""Appends length-prefixed records to rotating segment files. Each segment
+	has a JSON-lines sidecar index of offset, time, table and players."""
+
+	def __init__(self, path = HISTORY_DIR, segment_bytes = HISTORY_SEGMENT_BYTES):
+		self.path = path
+		self.segment_bytes = segment_bytes
+		self.file = None
+		self.index = None
+		os.makedirs(path, exist_ok=True)
+
+	def rotate(self):
+		self.close()
+		name = os.path.join(self.path, f"hands-{time.time():.6f}")
+		self.file = open(name + ".seg", "ab")
+		self.index = open(name + ".idx", "a")
+
+	def append(self, record):
+		if self.file is None or self.file.tell() >= self.segment_bytes:
+			self.rotate()
+		offset = self.file.tell()
+		self.file.write(encode(record))
+		self.file.flush()
+		self.index.write(json.dumps({"o": offset, "t": record.started, "h": record.hand_no, "tb": record.table_id, "p": record.players()}) + "\n")
+		self.index.flush()
+
+	def close(self):
+		if self.file:
+			self.file.close()
+			self.index.close()
+		self.file = self.index = None
+
+class HistoryReader():
+
+	def __init__(self, path = HISTORY_DIR):
+		self.path = path
+		self.maps = {}
+
+	def segments(self):
+		return sorted(os.path.join(self.path, name) for name in os.listdir(self.path) if name.endswith(".seg"))
+
+	def buffer(self, segment):
+		if segment not in self.maps:
+			with open(segment, "rb") as f:
+				self.maps[segment] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(segment) else b""
+		return self.maps[segment]
+
+	def read(self, segment, offset):
+		return decode(self.buffer(segment), offset)[0]
+
+	def __iter__(self):
+		for segment in self.segments():
+			buf, offset = self.buffer(segment), 0
+			while offset < len(buf):
+				record, offset = decode(buf, offset)
+				yield record
+
+	def entries(self):
+		for segment in self.segments():
+			index = segment[:-len(".seg")] + ".idx"
+			if not os.path.exists(index):
+				continue
+			with open(index) as f:
+				for line in f:
+					yield segment, json.loads(line)
+
+	def query(self, player = None, table_id = None, start = None, end = None):
+		for segment, entry in self.entries():
+			if player is not None and player not in entry["p"]:
+				continue
+			if table_id is not None and entry["tb"] != table_id:
+				continue
+			if (start is not None and entry["t"] < start) or (end is not None and entry["t"] >= end):
+				continue
+			yield self.read(segment, entry["o"])
+
+	def close(self):
+		for buf in self.maps.values():
+			if buf:
+				buf.close()
+		self.maps = {}
+
+class RecordedDeck():
+	# stands in for the shuffle service: every hand is dealt from this deck
+	def __init__(self, deck):
+		self.deck = bytes(deck)
+
+	def draw(self):
+		return shuffle.Shuffle(b"replay", self.deck)
+
+def same(a, b):
+	# everything but the clock
+	return (a.table_id, a.hand_no, a.big_blind, [tuple(seat) for seat in a.seats], list(a.positions), list(a.deck),
+		[tuple(action[1:]) for action in a.actions], list(a.board), [tuple(result) for result in a.result]) == \
+		(b.table_id, b.hand_no, b.big_blind, [tuple(seat) for seat in b.seats], list(b.positions), list(b.deck),
+		[tuple(action[1:]) for action in b.actions], list(b.board), [tuple(result) for result in b.result])
+
+async def replay(record):
+	"""Plays the hand again through the engine: a table seated as recorded is
+	dealt the recorded deck and takes each recorded action as the command a
+	client or the turn clock would send. Every action has to be legal and in
+	turn, and the hand the engine logs has to match the record action for
+	action, board and result. Returns the final stacks by seat and whether
+	it all matched."""
+	# the engine imports this module, so it is only imported to replay
+	import sim
+	import engine
+	import commands
+	logged = []
+	poker = engine.Poker(asyncio.get_event_loop(), record.table_id, sio = sim.HeadlessServer(), seed = 0, history = logged)
+	poker.shuffler = RecordedDeck(record.deck)
+	poker.runout_delay = 0
+	poker.table.big_blind = record.big_blind
+	poker.hands_played = record.hand_no - 1
+	for seat, name, stack in record.seats:
+		poker.sit(name, seat, stack)
+	# new_hand() moves the button on to the next seat dealt in; heads-up the
+	# button is first to act, otherwise last
+	button = record.positions[0] if len(record.positions) == 2 else record.positions[-1]
+	poker.table.button = (button - 1) % SEATS
+
+	async def drain():
+		# end_hand() deals the next hand straight away; that one is left alone
+		while not poker.queue.empty() and poker.hands_played == record.hand_no:
+			await poker.apply(poker.queue.get_nowait())
+
+	ok = True
+	try:
+		poker.start_hand()
+		await drain()
+		for at, seat, code, amount in record.actions[2:]:
+			if not poker.is_turn(seat):
+				ok = False
+				break
+			table = poker.table
+			name = table.seats[seat].username
+			action = ACTIONS[code]
+			if action == "raise":
+				command = commands.Raise(None, name, table.round.chips_out[seat] + amount)
+			elif action == "timeout":
+				command = commands.Timeout(poker.turn_no)
+			else:
+				command = {"check": commands.Check, "call": commands.Call, "fold": commands.Fold}[action](None, name)
+			await poker.apply(command)
+			await drain()
+	except commands.CommandError:
+		ok = False
+	finally:
+		poker.disarm_turn()
+	if not logged:
+		return {seat: stack for seat, name, stack in record.seats}, False
+	replayed = logged[0]
+	return {seat: stack for seat, stack, rank in replayed.result}, ok and same(replayed, record)
+
+log = None
+
+def get_log():
+	global log
+	if log is None:
+		log = HandLog()
+	return log
+
+def main():
+	import argparse
+	import datetime
+	parser = argparse.ArgumentParser(description="Query and replay logged hands")
+	parser.add_argument("--path", default=HISTORY_DIR)
+	parser.add_argument("--player")
+	parser.add_argument("--table")
+	parser.add_argument("--date", help="YYYY-MM-DD (UTC)")
+	args = parser.parse_args()
+	start = end = None
+	if args.date:
+		day = datetime.datetime.strptime(args.date, "%Y-%m-%d").replace(tzinfo=datetime.timezone.utc)
+		start, end = day.timestamp(), (day + datetime.timedelta(days=1)).timestamp()
+	reader = HistoryReader(args.path)
+	loop = asyncio.get_event_loop()
+	for record in reader.query(args.player, args.table, start, end):
+		stacks, ok = loop.run_until_complete(replay(record))
+		board = " ".join(evaluator.CARD_NAMES[c] for c in record.board)
+		print(f"{record.table_id} #{record.hand_no} {datetime.datetime.utcfromtimestamp(record.started):%Y-%m-%d %H:%M:%S} [{board}] {'ok' if ok else 'MISMATCH'}")
+	reader.close()
+
+if __name__ == "__main__":
+	main()
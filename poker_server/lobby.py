@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import state
+
+LOBBY_INTERVAL = float(os.getenv("LOBBY_INTERVAL", 1))
+# weight of the latest hand in the running averages, about the last 1 / LOBBY_ALPHA hands
+LOBBY_ALPHA = float(os.getenv("LOBBY_ALPHA", 0.1))
+# an average is pushed again once it drifts this far from what viewers have
+LOBBY_TOLERANCE = float(os.getenv("LOBBY_TOLERANCE", 0.1))
+ROOM = "lobby"
+AVERAGES = ("avg_pot", "hands_per_hour")
+
+class Stats():
+	__slots__ = ("pot", "gap", "last")
+
+	def __init__(self):
+		self.pot = None
+		self.gap = None
+		self.last = None
+
+class Lobby():
+	"""One summary row per table: stakes, seats filled, average pot and hands
+	an hour. Tables report in after each state batch and at every hand end;
+	a row is marked changed when its seats or stakes change or an average
+	drifts past the tolerance. Every interval the
+	changed rows go to the lobby room in one emit, tagged with a version a
+	client can check against the JSON listing it started from. The listing
+	is encoded at most once a version, with the version as its ETag."""
+
+	def __init__(self, sio = None, worker = 0, interval = LOBBY_INTERVAL, alpha = LOBBY_ALPHA, tolerance = LOBBY_TOLERANCE):
+		self.sio = sio
+		self.worker = worker
+		self.interval = interval
+		self.alpha = alpha
+		self.tolerance = tolerance
+		self.rows = {}
+		self.stats = {}
+		self.changed = set()
+		self.removed = set()
+		self.version = 0
+		self.cached = None
+
+	def row(self, table):
+		stats = self.stats.get(table.table_id)
+		pot = stats.pot if stats and stats.pot is not None else 0
+		rate = 3600 / stats.gap if table.hand_running and stats and stats.gap else 0
+		return {
+			"table": table.table_id,
+			"big_blind": table.table.big_blind,
+			"seats": state.SEATS,
+			"players": sum(1 for seat in table.table.seats if seat),
+			"avg_pot": int(round(pot)),
+			"hands_per_hour": int(round(rate)),
+		}
+
+	def update(self, table):
+		row = self.row(table)
+		old = self.rows.get(table.table_id)
+		if old is None or self.differs(old, row):
+			self.rows[table.table_id] = row
+			self.changed.add(table.table_id)
+			self.removed.discard(table.table_id)
+
+	def differs(self, old, row):
+		for key, value in row.items():
+			if key in AVERAGES:
+				if abs(value - old[key]) > self.tolerance * max(old[key], 1):
+					return True
+			elif value != old[key]:
+				return True
+		return False
+
+	def hand_ended(self, table, pot, now = None):
+		now = now if now is not None else time.time()
+		stats = self.stats.get(table.table_id)
+		if stats is None:
+			stats = self.stats[table.table_id] = Stats()
+		stats.pot = pot if stats.pot is None else stats.pot + self.alpha * (pot - stats.pot)
+		if stats.last is not None:
+			gap = now - stats.last
+			stats.gap = gap if stats.gap is None else stats.gap + self.alpha * (gap - stats.gap)
+		stats.last = now
+		self.update(table)
+
+	def remove(self, table_id):
+		if self.rows.pop(table_id, None) is not None:
+			self.stats.pop(table_id, None)
+			self.changed.discard(table_id)
+			self.removed.add(table_id)
+
+	def listing(self):
+		"""(body, etag) for the whole index, encoded once per version."""
+		if self.cached is None or self.cached[0] != self.version:
+			body = json.dumps({"worker": self.worker, "version": self.version, "tables": list(self.rows.values())}, separators=(",", ":")).encode()
+			etag = '"%s"' % hashlib.blake2b(body, digest_size=8).hexdigest()
+			self.cached = (self.version, body, etag)
+		return self.cached[1], self.cached[2]
+
+	def changes(self):
+		# the rows changed since the last version, and the version they make
+		if not self.changed and not self.removed:
+			return None
+		self.version += 1
+		message = {"worker": self.worker, "version": self.version, "rows": [self.rows[table_id] for table_id in self.changed], "removed": list(self.removed)}
+		self.changed = set()
+		self.removed = set()
+		return message
+
+	async def flush(self):
+		message = self.changes()
+		if message is not None and self.sio is not None:
+			await self.sio.emit('lobby', message, to=ROOM)
+		return message
+
+	async def run(self):
+		while True:
+			await asyncio.sleep(self.interval)
+			await self.flush()
+
+lobby = None
+
+def get_lobby(sio = None, worker = 0):
+	global lobby
+	if lobby is None:
+		lobby = Lobby(sio, worker)
+	return lobby
@@ -0,0 +1,181 @@
+import os
+import sys
+import math
+import time
+import asyncio
+import bisect
+import threading
+import collections
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+METRICS_BYTES_SAMPLE = int(os.getenv("METRICS_BYTES_SAMPLE", 100))
+LAG_INTERVAL = float(os.getenv("METRICS_LAG_INTERVAL", 0.5))
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+BYTES_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144)
+
+def _labels(names, values):
+	if not names:
+		return ""
+	return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, values)) + "}"
+
+class Counter():
+
+	def __init__(self, name, help, labels = ()):
+		self.name = name
+		self.help = help
+		self.labels = labels
+		self.values = collections.defaultdict(float)
+
+	def inc(self, *labels, amount = 1):
+		self.values[labels] += amount
+
+	def render(self):
+		yield f"# HELP {self.name} {self.help}"
+		yield f"# TYPE {self.name} counter"
+		for labels, value in sorted(self.values.items()):
+			yield f"{self.name}{_labels(self.labels, labels)} {value:g}"
+
+class Gauge():
+	"""Read at scrape time from a callback that yields (labels, value) pairs."""
+
+	def __init__(self, name, help, labels = (), collect = None):
+		self.name = name
+		self.help = help
+		self.labels = labels
+		self.collect = collect
+
+	def render(self):
+		yield f"# HELP {self.name} {self.help}"
+		yield f"# TYPE {self.name} gauge"
+		for labels, value in (self.collect() if self.collect else ()):
+			yield f"{self.name}{_labels(self.labels, labels)} {value:g}"
+
+class Histogram():
+
+	def __init__(self, name, help, labels = (), buckets = LATENCY_BUCKETS):
+		self.name = name
+		self.help = help
+		self.labels = labels
+		self.buckets = buckets
+		self.series = {}
+
+	def observe(self, value, *labels):
+		series = self.series.get(labels)
+		if series is None:
+			series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+		series[0][bisect.bisect_left(self.buckets, value)] += 1
+		series[1] += value
+
+	def time(self, *labels):
+		return _Timer(self, labels)
+
+	def render(self):
+		yield f"# HELP {self.name} {self.help}"
+		yield f"# TYPE {self.name} histogram"
+		for labels, (counts, total) in sorted(self.series.items()):
+			running = 0
+			for bound, count in zip(self.buckets + (float("inf"),), counts):
+				running += count
+				le = "+Inf" if bound == float("inf") else f"{bound:g}"
+				yield f"{self.name}_bucket{_labels(self.labels + ('le',), labels + (le,))} {running}"
+			yield f"{self.name}_sum{_labels(self.labels, labels)} {total:g}"
+			yield f"{self.name}_count{_labels(self.labels, labels)} {running}"
+
+class _Timer():
+	__slots__ = ("histogram", "labels", "start")
+
+	def __init__(self, histogram, labels):
+		self.histogram = histogram
+		self.labels = labels
+
+	def __enter__(self):
+		self.start = time.perf_counter()
+
+	def __exit__(self, *exc):
+		self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+registry = []
+
+def register(metric):
+	registry.append(metric)
+	return metric
+
+def render():
+	return "\n".join(line for metric in registry for line in metric.render()) + "\n"
+
+action_latency = register(Histogram("poker_action_broadcast_seconds", "From a player's action arriving to the state broadcast that follows it", ("action",)))
+engine_seconds = register(Histogram("poker_engine_seconds", "Time spent in engine hot paths", ("step",)))
+broadcast_messages = register(Counter("poker_broadcast_messages_total", "State messages sent, by kind", ("kind",)))
+broadcast_bytes = register(Histogram("poker_broadcast_bytes", f"State message size; JSON messages are sampled 1 in {METRICS_BYTES_SAMPLE}", ("kind",), BYTES_BUCKETS))
+notify_fanout = register(Histogram("poker_notify_fanout", "Viewers sent a message per notify_state", buckets = (1, 2, 5, 10, 25, 50, 100)))
+db_seconds = register(Histogram("poker_db_seconds", "Ledger call latency including executor queueing", ("call",)))
+loop_lag = register(Histogram("poker_event_loop_lag_seconds", "How late a periodic sleep wakes up"))
+hands = register(Counter("poker_hands_total", "Hands dealt"))
+token_checks = register(Counter("poker_token_checks_total", "Access tokens checked on socket connect, by cache result", ("result",)))
+bot_decision = register(Histogram("poker_bot_decision_seconds", "From a house bot's turn starting to its move being sent", ("strategy",)))
+bot_timeouts = register(Counter("poker_bot_timeouts_total", "House bot decisions that missed their budget and checked or folded", ("strategy",)))
+command_failures = register(Counter("poker_command_failures_total", "Table commands that raised an unexpected error", ("action",)))
+
+def watch_tables(tables):
+	register(Gauge("poker_table_queue_depth", "Events waiting in each table's queue", ("table",),
+		lambda: [((table.table_id,), table.queue.qsize()) for table in tables]))
+	register(Gauge("poker_table_viewers", "Connected viewers per table", ("table",),
+		lambda: [((table.table_id,), len(table.users)) for table in tables]))
+
+async def monitor_lag(interval = LAG_INTERVAL):
+	loop = asyncio.get_event_loop()
+	while True:
+		start = loop.time()
+		await asyncio.sleep(interval)
+		loop_lag.observe(loop.time() - start - interval)
+
+class Profiler():
+	"""Sampling profiler for the event loop thread. While running, a daemon
+	thread records the loop thread's stack every interval; report() returns
+	collapsed stacks ("frame;frame;frame count") for flamegraph tools."""
+
+	# bounds on the sampling interval, in seconds
+	FASTEST = 0.001
+	SLOWEST = 1.0
+
+	def __init__(self, interval = 0.005):
+		self.interval = interval
+		self.thread = None
+		self.target = None
+		self.running = False
+		self.stacks = collections.Counter()
+
+	def start(self, interval = None):
+		if self.running:
+			return
+		if interval and math.isfinite(interval):
+			self.interval = min(max(interval, self.FASTEST), self.SLOWEST)
+		self.target = threading.get_ident()
+		self.stacks = collections.Counter()
+		self.running = True
+		self.thread = threading.Thread(target=self._sample, name="profiler", daemon=True)
+		self.thread.start()
+
+	def stop(self):
+		self.running = False
+		if self.thread:
+			self.thread.join()
+			self.thread = None
+
+	def _sample(self):
+		while self.running:
+			frame = sys._current_frames().get(self.target)
+			stack = []
+			while frame is not None:
+				code = frame.f_code
+				stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+				frame = frame.f_back
+			if stack:
+				self.stacks[";".join(reversed(stack))] += 1
+			time.sleep(self.interval)
+
+	def report(self):
+		return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+profiler = Profiler()
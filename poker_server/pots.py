@@ -0,0 +1,66 @@
+import itertools
+
+# Chips a hand's players put in are layered into a main pot and side pots by
+# the contribution levels of the players still live, so an all-in player only
+# contests the chips they covered.
+
+def side_pots(contributed, live):
+	"""contributed maps every seat that put chips in to its total for the hand,
+	live lists the seats still in it. Returns (amount, eligible seats) pairs,
+	main pot first; each pot's eligible seats include the next one's. Chips
+	above the deepest live stack (a folded player's uncalled bet) go into the
+	last pot."""
+	order = sorted(live, key = lambda seat: contributed.get(seat, 0))
+	stacks = sorted(contributed.values())
+	pots = []
+	level = taken = 0
+	i = 0
+	for n, seat in enumerate(order):
+		top = contributed.get(seat, 0)
+		if top == level:
+			continue
+		# chips of everyone in between this level and the last, in one sweep
+		# over the sorted contributions
+		amount = 0
+		while i < len(stacks) and stacks[i] <= top:
+			amount += stacks[i] - level if stacks[i] > level else 0
+			i += 1
+		amount += (len(stacks) - i) * (top - level)
+		pots.append((amount, order[n:]))
+		taken += amount
+		level = top
+	rest = sum(stacks) - taken
+	if rest:
+		if pots:
+			pots[-1] = (pots[-1][0] + rest, pots[-1][1])
+		else:
+			pots.append((rest, list(live)))
+	return pots
+
+def award(pots, ranks, order):
+	"""Chips won per seat. Live seats are taken once in descending rank; each
+	tier of equal hands takes every remaining pot one of them is eligible for.
+	A split pot's odd chips go one each to the tied winners in order, the
+	first seat left of the button first."""
+	won = {}
+	place = {seat: i for i, seat in enumerate(order)}
+	live = pots[0][1] if pots else []
+	ranked = sorted(live, key = lambda seat: (-ranks[seat], place[seat]))
+	start = 0
+	for rank, tier in itertools.groupby(ranked, key = lambda seat: ranks[seat]):
+		tier = list(tier)
+		while start < len(pots):
+			amount, eligible = pots[start]
+			winners = [seat for seat in tier if seat in eligible]
+			if not winners:
+				break
+			share, odd = divmod(amount, len(winners))
+			for i, seat in enumerate(winners):
+				won[seat] = won.get(seat, 0) + share + (1 if i < odd else 0)
+			start += 1
+		if start == len(pots):
+			break
+	return won
+
+def settle(contributed, live, ranks, order):
+	return award(side_pots(contributed, live), ranks, order)
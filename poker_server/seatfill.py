@@ -0,0 +1,138 @@
+import os
+import time
+import asyncio
+import itertools
+from concurrent.futures import ProcessPoolExecutor, BrokenExecutor
+import bots
+import metrics
+
+BOT_FILL = int(os.getenv("BOT_FILL", 0))
+BOT_MIN_HUMANS = int(os.getenv("BOT_MIN_HUMANS", 1))
+BOT_STRATEGY = os.getenv("BOT_STRATEGY", "equity")
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", 2))
+# in big blinds; a busted bot is topped back up at the next hand
+BOT_STACK = int(os.getenv("BOT_STACK", 100))
+# play-money tables opened at boot for the bots to fill
+BOT_TABLES = [table_id for table_id in os.getenv("BOT_TABLES", "").split(",") if table_id]
+# share of the budget a pooled bot spends sampling, the rest covers the round trip
+SAMPLING_SHARE = 0.8
+
+class SeatFiller():
+	"""House bots for play-money tables short of players. At each hand
+	boundary a table with at least min_humans people seated is topped up with
+	bots to fill players, and a bot stands up for every human past that. Bots
+	never sit where chips are settled to the ledger, since their stacks come
+	from nowhere. A bot's move goes
+	in through on_json like a client's. Pooled strategies decide in a worker
+	process; one that misses the budget checks or folds instead, so neither
+	the loop nor the table waits on it."""
+
+	def __init__(self, fill = BOT_FILL, strategy = BOT_STRATEGY, budget = bots.BOT_BUDGET, workers = BOT_WORKERS,
+		stack = BOT_STACK, min_humans = BOT_MIN_HUMANS, seed = None):
+		self.fill = fill
+		self.strategy = bots.STRATEGIES[strategy]
+		self.budget = budget
+		self.workers = workers
+		self.stack = stack
+		self.min_humans = min_humans
+		self.seed = seed
+		self.executor = None
+		self.bots = {}
+		self.numbers = itertools.count()
+
+	def get_executor(self):
+		if self.executor is None:
+			self.executor = ProcessPoolExecutor(max_workers=self.workers)
+			# load the evaluator tables in every worker before the first real decision
+			for _ in range(self.workers):
+				self.executor.submit(bots.estimate, [0, 1], [], 1, 1)
+		return self.executor
+
+	def is_bot(self, username):
+		return username in self.bots
+
+	def new_bot(self, name = None):
+		number = next(self.numbers)
+		if name is None:
+			# skipping names adopted from a snapshot
+			while f"bot-{number}" in self.bots:
+				number = next(self.numbers)
+			name = f"bot-{number}"
+		seed = None if self.seed is None else self.seed + number
+		if self.strategy.pooled:
+			bot = self.strategy(name, seed, budget = self.budget * SAMPLING_SHARE)
+		else:
+			bot = self.strategy(name, seed)
+		self.bots[name] = bot
+		return bot
+
+	def adopt(self, username):
+		# a bot seated by an earlier process or another worker
+		if username not in self.bots:
+			self.new_bot(username)
+
+	def release(self, username):
+		# a bot whose table moved to another worker
+		self.bots.pop(username, None)
+
+	def refill(self, poker):
+		"""Seat or stand up bots between hands. Returns whether any seat changed."""
+		table = poker.table
+		house = [i for i, seat in enumerate(table.seats) if seat and seat.username in self.bots]
+		humans = sum(1 for seat in table.seats if seat) - len(house)
+		wanted = self.fill - humans if humans >= self.min_humans and poker.play_money else 0
+		changed = False
+		while len(house) > max(wanted, 0):
+			seat = house.pop()
+			del self.bots[table.seats[seat].username]
+			table.seats[seat] = None
+			changed = True
+		for seat in house:
+			if table.seats[seat].chips < table.big_blind:
+				table.seats[seat].chips = self.stack * table.big_blind
+		while len(house) < wanted and None in table.seats:
+			seat = table.seats.index(None)
+			poker.sit(self.new_bot().name, seat, self.stack * table.big_blind)
+			house.append(seat)
+			changed = True
+		return changed
+
+	def turn(self, poker):
+		seat = poker.table.turn.action_player
+		bot = self.bots.get(poker.table.seats[seat].username)
+		if bot is not None:
+			poker.spawn(self.act(poker, bot, seat, poker.turn_no))
+
+	async def act(self, poker, bot, seat, turn_no):
+		table = poker.table
+		strategy = type(bot).__name__
+		start = time.perf_counter()
+		if bot.pooled:
+			try:
+				future = poker.loop.run_in_executor(self.get_executor(), bot.decide, *bot.spot(table, seat))
+				action = await asyncio.wait_for(future, self.budget)
+			except asyncio.TimeoutError:
+				metrics.bot_timeouts.inc(strategy)
+				action = {"action": "check" if bot.owed(table, seat) <= 0 else "fold"}
+			except RuntimeError as e:
+				# the pool is shut down or broken; the bot checks or folds
+				if isinstance(e, BrokenExecutor):
+					print(f"{poker.table_id}: bot pool broken: {e!r}")
+				action = {"action": "check" if bot.owed(table, seat) <= 0 else "fold"}
+		else:
+			action = bot.act(table, seat)
+		metrics.bot_decision.observe(time.perf_counter() - start, strategy)
+		if poker.turn_no == turn_no:
+			await poker.on_json(None, bot.name, action)
+
+def table_options():
+	# TableManager.create() arguments for a play-money table the bots fill
+	return {"settlement": None, "play_money": True, "bots": get_filler()}
+
+filler = None
+
+def get_filler():
+	global filler
+	if filler is None and BOT_FILL:
+		filler = SeatFiller()
+	return filler
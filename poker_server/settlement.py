@@ -0,0 +1,179 @@
+import os
+import json
+import asyncio
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+import database
+
+SETTLE_INTERVAL = float(os.getenv("SETTLE_INTERVAL", 0.5))
+SETTLE_HANDS = int(os.getenv("SETTLE_HANDS", 50))
+# each worker journals to its own file and keeps its own mark; cluster.main
+# gives every worker a path of its own
+JOURNAL_PATH = os.getenv("JOURNAL_PATH", (database.DATABASE or "poker.db") + "-settle.journal")
+WORKER_INDEX = int(os.getenv("WORKER_INDEX", 0))
+
+SETUP = [
+	"CREATE TABLE IF NOT EXISTS seated (username text, table_id text, chips real)",
+	"CREATE TABLE IF NOT EXISTS settle_mark (worker integer PRIMARY KEY, seq integer)",
+]
+INSERT_MARK = "INSERT OR IGNORE INTO settle_mark VALUES (?, 0)"
+SELECT_MARK = "SELECT seq FROM settle_mark WHERE worker = ?"
+UPDATE_MARK = "UPDATE settle_mark SET seq = ? WHERE worker = ?"
+APPLY_DELTA = "UPDATE seated SET chips = chips + ? WHERE username = ? AND table_id = ?"
+SELECT_SEATED = "SELECT * FROM seated"
+
+def _setup(con, worker):
+	database.transaction(con, [(query, ()) for query in SETUP] + [(INSERT_MARK, (worker,))])
+	return con.execute(SELECT_MARK, (worker,)).fetchone()["seq"]
+
+def _apply(con, entries, worker):
+	con.execute("BEGIN IMMEDIATE")
+	try:
+		mark = con.execute(SELECT_MARK, (worker,)).fetchone()["seq"]
+		totals = {}
+		for entry in entries:
+			if entry["seq"] <= mark:
+				continue
+			for username, delta in entry["deltas"].items():
+				key = (username, entry["table"])
+				totals[key] = totals.get(key, 0) + delta
+			mark = entry["seq"]
+		con.executemany(APPLY_DELTA, [(delta, username, table_id) for (username, table_id), delta in totals.items()])
+		con.execute(UPDATE_MARK, (mark, worker))
+		con.execute("COMMIT")
+		return mark
+	except Exception:
+		con.execute("ROLLBACK")
+		raise
+
+def _seated(con):
+	return {(row["username"], row["table_id"]): row["chips"] for row in con.execute(SELECT_SEATED).fetchall()}
+
+def _release(con, owns, kept):
+	rows = [row for row in con.execute(SELECT_SEATED).fetchall() if owns(row["table_id"]) and (row["username"], row["table_id"]) not in kept]
+	statements = []
+	for row in rows:
+		statements.append((database.CASH_OUT, (row["chips"], row["username"])))
+		statements.append((database.UNSEAT, (row["username"], row["table_id"])))
+	if statements:
+		database.transaction(con, statements)
+	return [(row["username"], row["table_id"], row["chips"]) for row in rows]
+
+class Settlement():
+	"""Write-behind settlement of end-of-hand stack deltas. Each hand is appended
+	to an fsync'd journal first, then folded into the seated table in batched
+	transactions. settle_mark records the last applied journal seq per worker,
+	so replaying after a crash never applies a hand twice."""
+
+	def __init__(self, path = JOURNAL_PATH, interval = SETTLE_INTERVAL, hands = SETTLE_HANDS, worker = WORKER_INDEX):
+		self.path = path
+		self.worker = worker
+		self.interval = interval
+		self.hands = hands
+		self.pending = []
+		self.seq = 0
+		self.file = None
+		self.journal = ThreadPoolExecutor(max_workers=1, thread_name_prefix="settle-journal")
+		self.wakeup = None
+		self.flushing = asyncio.Lock()
+
+	def _read(self):
+		if not os.path.exists(self.path):
+			return []
+		with open(self.path) as f:
+			return [json.loads(line) for line in f if line.strip()]
+
+	def _append(self, entry):
+		if self.file is None:
+			self.file = open(self.path, "a")
+		self.file.write(json.dumps(entry) + "\n")
+		self.file.flush()
+		os.fsync(self.file.fileno())
+
+	def _compact(self, mark):
+		entries = [entry for entry in self._read() if entry["seq"] > mark]
+		tmp = self.path + ".tmp"
+		with open(tmp, "w") as f:
+			f.writelines(json.dumps(entry) + "\n" for entry in entries)
+			f.flush()
+			os.fsync(f.fileno())
+		if self.file:
+			self.file.close()
+		os.replace(tmp, self.path)
+		self.file = open(self.path, "a")
+
+	async def in_journal(self, fn, *args):
+		return await asyncio.get_event_loop().run_in_executor(self.journal, fn, *args)
+
+	async def start(self, owns = lambda table_id: True):
+		"""replay() then release(), for a worker with no tables to restore."""
+		await self.replay()
+		return await self.release(owns)
+
+	async def replay(self):
+		"""Applies unsettled journal entries, so the seated table holds every
+		stack as of the last hand this worker finished."""
+		self.wakeup = asyncio.Event()
+		ledger = database.get_ledger()
+		mark = await ledger.write(_setup, self.worker)
+		entries = await self.in_journal(self._read)
+		if entries:
+			mark = await ledger.write(_apply, entries, self.worker)
+			self.seq = max(entry["seq"] for entry in entries)
+		self.seq = max(self.seq, mark)
+		await self.in_journal(self._compact, mark)
+
+	async def seated(self):
+		return await database.get_ledger().read(_seated)
+
+	async def release(self, owns = lambda table_id: True, kept = ()):
+		"""Cashes out stacks left seated at this worker's tables by a previous
+		process, except the (username, table_id) seats a restored table holds."""
+		return await database.get_ledger().write(_release, owns, set(kept))
+
+	async def record(self, table_id, deltas):
+		deltas = {username: delta for username, delta in deltas.items() if delta}
+		if not deltas:
+			return
+		self.seq += 1
+		entry = {"seq": self.seq, "table": table_id, "deltas": deltas}
+		await self.in_journal(self._append, entry)
+		self.pending.append(entry)
+		if len(self.pending) >= self.hands and self.wakeup:
+			self.wakeup.set()
+
+	async def flush(self):
+		# one flush at a time: a later batch applied first would move the mark
+		# past an earlier one still in flight
+		async with self.flushing:
+			entries, self.pending = self.pending, []
+			if not entries:
+				return
+			try:
+				mark = await database.get_ledger().write(_apply, entries, self.worker)
+			except Exception:
+				# still journalled; they go with the next flush
+				self.pending[:0] = entries
+				raise
+			await self.in_journal(self._compact, mark)
+
+	async def run(self):
+		while True:
+			try:
+				await asyncio.wait_for(self.wakeup.wait(), self.interval)
+			except asyncio.TimeoutError:
+				pass
+			self.wakeup.clear()
+			try:
+				await self.flush()
+			except Exception:
+				print("settlement flush failed, retrying")
+				traceback.print_exc()
+
+settlement = None
+
+def get_settlement():
+	global settlement
+	if settlement is None:
+		settlement = Settlement()
+	return settlement
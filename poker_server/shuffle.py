@@ -0,0 +1,100 @@
+import os
+import hashlib
+import threading
+import collections
+import numpy as np
+import evaluator
+
+SHUFFLE_BATCH = int(os.getenv("SHUFFLE_BATCH", 512))
+
+# Every deck comes from a 32-byte seed: SHAKE-256 of the seed gives 52 64-bit
+# keys and the deck is the card indices sorted by key. The commitment published
+# when a hand starts is SHA-256 of the seed, and the seed itself is published
+# when the hand ends, so anyone can check the deck was fixed before the deal.
+# Seeds come from os.urandom, or from SHA-256 of a master seed and a counter
+# when a table is seeded for a reproducible run.
+
+KEY_BYTES = 52 * 8
+
+class Shuffle():
+	__slots__ = ("seed", "deck", "commitment")
+
+	def __init__(self, seed, deck):
+		self.seed = seed
+		self.deck = deck
+		self.commitment = commit(seed)
+
+	def cards(self):
+		return [evaluator.CARD_NAMES[card] for card in self.deck]
+
+def commit(seed):
+	return hashlib.sha256(seed).hexdigest()
+
+def deal(seed):
+	"""The deck a seed gives, as 52 bytes of card indices."""
+	keys = np.frombuffer(hashlib.shake_256(seed).digest(KEY_BYTES), dtype="<u8")
+	return np.argsort(keys, kind="stable").astype(np.uint8).tobytes()
+
+def deal_batch(seeds):
+	keys = np.frombuffer(b"".join(hashlib.shake_256(seed).digest(KEY_BYTES) for seed in seeds), dtype="<u8")
+	decks = np.argsort(keys.reshape(len(seeds), 52), axis=1, kind="stable").astype(np.uint8)
+	return [Shuffle(seed, row.tobytes()) for seed, row in zip(seeds, decks)]
+
+def verify(seed, commitment, deck):
+	return commit(seed) == commitment and deal(seed) == bytes(deck)
+
+class ShuffleService():
+	"""Decks dealt ahead in batches. A background thread refills the queue
+	whenever it falls under half a batch, so draw() is normally one popleft;
+	if the queue runs dry a batch is dealt on the spot. Seeded services hand
+	out the same decks in the same order every run."""
+
+	def __init__(self, seed = None, batch = SHUFFLE_BATCH, background = True):
+		self.master = hashlib.sha256(str(seed).encode()).digest() if seed is not None else None
+		self.batch = batch
+		self.counter = 0
+		self.ready = collections.deque()
+		self.lock = threading.Lock()
+		self.wanted = threading.Event()
+		self.thread = None
+		if background:
+			self.thread = threading.Thread(target=self._refill, name="shuffle", daemon=True)
+			self.thread.start()
+
+	def seeds(self, n):
+		if self.master is None:
+			data = os.urandom(32 * n)
+			return [data[i:i + 32] for i in range(0, len(data), 32)]
+		start, self.counter = self.counter, self.counter + n
+		return [hashlib.sha256(self.master + i.to_bytes(8, "little")).digest() for i in range(start, start + n)]
+
+	def fill(self):
+		# under the lock so seeded decks queue in counter order
+		with self.lock:
+			self.ready.extend(deal_batch(self.seeds(self.batch)))
+
+	def _refill(self):
+		while True:
+			self.fill()
+			self.wanted.clear()
+			if len(self.ready) < self.batch // 2:
+				continue
+			self.wanted.wait()
+
+	def draw(self):
+		try:
+			shuffle = self.ready.popleft()
+		except IndexError:
+			self.fill()
+			shuffle = self.ready.popleft()
+		if self.thread and len(self.ready) < self.batch // 2:
+			self.wanted.set()
+		return shuffle
+
+service = None
+
+def get_service():
+	global service
+	if service is None:
+		service = ShuffleService()
+	return service
@@ -0,0 +1,112 @@
+import json
+import time
+import asyncio
+import commands
+from engine import Poker
+from bots import RandomBot
+
+class HeadlessServer():
+	"""Takes the socket.io server's place for a table run in-process. It keeps
+	room membership, counts what would have gone over the wire and wakes the
+	harness on every emit. With measure on, each recipient's payload is encoded
+	separately, as socket.io does when it delivers to a room, except through
+	emit_shared() which encodes once for the room."""
+
+	def __init__(self, measure = False):
+		self.measure = measure
+		self.emits = 0
+		self.deliveries = 0
+		self.bytes = 0
+		self.encodes = 0
+		self.errors = []
+		self.rooms = {}
+		self.changed = asyncio.Event()
+
+	async def emit(self, event, data = None, to = None, **kwargs):
+		self.emits += 1
+		recipients = len(self.rooms.get(to, ())) or 1
+		self.deliveries += recipients
+		if self.measure:
+			for _ in range(recipients):
+				self.bytes += self.encode(event, data)
+		self.changed.set()
+
+	async def emit_shared(self, event, data = None, to = None, **kwargs):
+		self.emits += 1
+		recipients = len(self.rooms.get(to, ()))
+		self.deliveries += recipients
+		if self.measure and recipients:
+			self.bytes += self.encode(event, data) * recipients
+		self.changed.set()
+
+	def encode(self, event, data):
+		self.encodes += 1
+		return len(data) if isinstance(data, bytes) else len(json.dumps([event, data]))
+
+	async def send(self, data, to = None, **kwargs):
+		if isinstance(data, dict) and "error" in data:
+			self.errors.append(data["error"])
+		self.changed.set()
+
+	def enter_room(self, sid, room, **kwargs):
+		self.rooms.setdefault(room, set()).add(sid)
+
+	def leave_room(self, sid, room, **kwargs):
+		self.rooms.get(room, set()).discard(sid)
+
+class Harness():
+	"""Seats bots at a headless table and plays hands as fast as the engine
+	allows, timing each action until the state broadcast that follows it."""
+
+	def __init__(self, bots, seed = 0, stack = 10 ** 9, turn_time = 10, table_id = "sim", measure = False, **kwargs):
+		self.loop = asyncio.get_event_loop()
+		self.server = HeadlessServer(measure)
+		self.table = Poker(self.loop, table_id, sio = self.server, seed = seed, **kwargs)
+		self.table.turn_time = turn_time
+		# all-in runouts dealt straight out rather than paced for viewers
+		self.table.runout_delay = 0
+		self.bots = {}
+		for seat, bot in enumerate(bots):
+			self.table.sit(bot.name, seat, stack)
+			self.table.add_user(f"sid-{bot.name}", bot.name)
+			self.bots[seat] = bot
+		self.latencies = []
+		self.actions = 0
+
+	def to_act(self):
+		for seat, bot in self.bots.items():
+			if self.table.is_turn(seat):
+				return seat, bot
+		return None, None
+
+	def busted(self):
+		# no hand running and nobody left to play one against
+		table = self.table.table
+		return not self.table.hand_running and self.table.queue.empty() and sum(1 for seat in table.seats if seat and seat.chips > 0) < 2
+
+	async def run(self, hands, timeout = None):
+		task = self.loop.create_task(self.table.main())
+		self.table.submit(commands.Start())
+		deadline = self.loop.time() + timeout if timeout else None
+		try:
+			while self.table.hands_played <= hands:
+				if deadline and self.loop.time() > deadline:
+					break
+				self.server.changed.clear()
+				seat, bot = self.to_act()
+				if bot is None:
+					if self.busted():
+						break
+					await self.server.changed.wait()
+					continue
+				start = time.perf_counter()
+				await self.table.on_json(None, bot.name, bot.act(self.table.table, seat))
+				await self.server.changed.wait()
+				self.latencies.append(time.perf_counter() - start)
+				self.actions += 1
+		finally:
+			task.cancel()
+		return min(self.table.hands_played, hands)
+
+def random_table(players, seed = 0, **kwargs):
+	return Harness([RandomBot(f"bot{i}", seed + i) for i in range(players)], seed = seed, **kwargs)
@@ -0,0 +1,151 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+import database
+import metrics
+import seatfill
+
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", (database.DATABASE or "poker.db") + "-tables")
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", 1))
+
+SETUP = "CREATE TABLE IF NOT EXISTS snapshots (table_id text PRIMARY KEY, version integer, saved real, state text)"
+UPSERT = ("INSERT INTO snapshots VALUES (?, ?, ?, ?) ON CONFLICT(table_id) DO UPDATE SET "
+	"version = excluded.version, saved = excluded.saved, state = excluded.state")
+DELETE = "DELETE FROM snapshots WHERE table_id = ?"
+SELECT = "SELECT table_id, state FROM snapshots"
+
+def current(table_id, snapshot, seated):
+	"""Whether the snapshot's stacks agree with the ledger. Seated players'
+	stacks as of the start of the hand in progress, or as they sit between
+	hands, must be what the settled ledger holds; otherwise a hand finished
+	and was settled after the snapshot was taken."""
+	if snapshot.get("play_money"):
+		return True
+	progress = snapshot.get("hand")
+	start = progress["hand_start"] if progress else {}
+	bots = set(snapshot["bots"])
+	for seat in snapshot["seats"]:
+		if not seat or seat[0] in bots:
+			continue
+		username, chips = seat
+		if abs(seated.get((username, table_id), -1) - start.get(username, chips)) > 1e-6:
+			return False
+	return True
+
+def reseat(table_id, snapshot, seated):
+	# a stale snapshot keeps its seats with the ledger's stacks and no hand
+	snapshot.pop("hand", None)
+	bots = set(snapshot["bots"])
+	seats = snapshot["seats"]
+	for i, seat in enumerate(seats):
+		if seat and seat[0] not in bots:
+			chips = seated.get((seat[0], table_id))
+			# the ledger column is real; stacks are packed as integers
+			seats[i] = [seat[0], int(round(chips))] if chips is not None else None
+
+class Snapshots():
+	"""Periodic snapshots of every cash table, hand in progress and deck
+	included, to a local SQLite file. A pass only writes tables whose state
+	version moved since the last one; rows are encoded and written on one
+	writer thread in a single transaction. On boot restore() rebuilds the
+	tables and carries on any hand mid-street."""
+
+	def __init__(self, path = SNAPSHOT_PATH, interval = SNAPSHOT_INTERVAL):
+		self.path = path
+		self.interval = interval
+		self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="snapshot-writer")
+		self.con = None
+		self.saved = {}
+
+	def connection(self):
+		if self.con is None:
+			self.con = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+			self.con.execute("PRAGMA journal_mode=WAL")
+			self.con.execute("PRAGMA synchronous=NORMAL")
+			self.con.execute(SETUP)
+		return self.con
+
+	def _write(self, rows, dropped):
+		con = self.connection()
+		now = time.time()
+		con.execute("BEGIN IMMEDIATE")
+		try:
+			con.executemany(UPSERT, [(table_id, version, now, json.dumps(snapshot, separators=(",", ":"))) for table_id, version, snapshot in rows])
+			con.executemany(DELETE, [(table_id,) for table_id in dropped])
+			con.execute("COMMIT")
+		except Exception:
+			con.execute("ROLLBACK")
+			raise
+
+	def _read(self):
+		return [(table_id, json.loads(state)) for table_id, state in self.connection().execute(SELECT).fetchall()]
+
+	async def in_writer(self, fn, *args):
+		return await asyncio.get_event_loop().run_in_executor(self.writer, fn, *args)
+
+	def collect(self, tables):
+		# tournament tables are rebuilt by their director and a migrating
+		# table is saved by the worker adopting it
+		rows = []
+		live = set()
+		for table in tables:
+			if table.director is not None or table.migrating is not None:
+				continue
+			live.add(table.table_id)
+			if self.saved.get(table.table_id) != table.version:
+				rows.append((table.table_id, table.version, table.snapshot()))
+		return rows, [table_id for table_id in self.saved if table_id not in live]
+
+	async def save(self, tables):
+		with metrics.engine_seconds.time("snapshot"):
+			rows, dropped = self.collect(tables)
+		if rows or dropped:
+			await self.in_writer(self._write, rows, dropped)
+		for table_id in dropped:
+			del self.saved[table_id]
+		for table_id, version, snapshot in rows:
+			self.saved[table_id] = version
+		return len(rows)
+
+	async def run(self, tables):
+		while True:
+			await asyncio.sleep(self.interval)
+			await self.save(tables)
+
+	async def restore(self, tables, seated, owns = lambda table_id: True):
+		"""Recreates this worker's tables from their snapshots, checked against
+		seated, the ledger's {(username, table_id): chips} after the settlement
+		journal is replayed. Returns the (username, table_id) of every seat put
+		back, a player at several tables once for each."""
+		kept = []
+		for table_id, snapshot in await self.in_writer(self._read):
+			if not owns(table_id):
+				continue
+			fresh = current(table_id, snapshot, seated)
+			if not fresh:
+				reseat(table_id, snapshot, seated)
+			options = seatfill.table_options() if snapshot.get("play_money") else {}
+			try:
+				tables.create(table_id, **options).resume(snapshot)
+			except (KeyError, TypeError, ValueError):
+				# written by a version with other fields: seats only
+				tables.destroy(table_id)
+				snapshot.pop("hand", None)
+				tables.create(table_id, **options).resume(snapshot)
+				fresh = False
+			if fresh:
+				self.saved[table_id] = snapshot["version"]
+			bots = set(snapshot["bots"])
+			kept.extend((seat[0], table_id) for seat in snapshot["seats"] if seat and seat[0] not in bots)
+		return kept
+
+snapshots = None
+
+def get_snapshots():
+	global snapshots
+	if snapshots is None:
+		snapshots = Snapshots()
+	return snapshots
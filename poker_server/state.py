@@ -0,0 +1,195 @@
+import evaluator
+
+SEATS = 9
+
+# Seats are a ring and sets of seats are bitmasks. NEXT[mask << 4 | seat] is
+# the first seat after seat, going round the table, that is in mask (seat
+# itself last), or -1 for an empty mask; COUNT[mask] is its population.
+
+def _next(mask, seat):
+	for step in range(1, SEATS + 1):
+		candidate = (seat + step) % SEATS
+		if mask >> candidate & 1:
+			return candidate
+	return -1
+
+NEXT = [_next(mask, seat) if seat < SEATS else -1 for mask in range(1 << SEATS) for seat in range(16)]
+COUNT = [bin(mask).count("1") for mask in range(1 << SEATS)]
+
+def next_seat(mask, seat):
+	return NEXT[mask << 4 | seat]
+
+def distance(start, seat):
+	# steps round the table from start to seat, a full lap when they are equal
+	return (seat - start - 1) % SEATS + 1
+
+def ring(mask, after):
+	"""Seats in mask in the order they come round the table after after."""
+	seats = []
+	seat = after
+	for _ in range(COUNT[mask]):
+		seat = NEXT[mask << 4 | seat]
+		seats.append(seat)
+	return seats
+
+def to_mask(seats):
+	mask = 0
+	for seat in seats:
+		mask |= 1 << seat
+	return mask
+
+def dump(obj):
+	"""A slotted object's fields as a dict, lists copied so it can be encoded off the loop."""
+	return {slot: list(value) if isinstance(value, list) else value for slot, value in ((slot, getattr(obj, slot)) for slot in obj.__slots__)}
+
+def load(cls, fields):
+	obj = cls.__new__(cls)
+	for slot in cls.__slots__:
+		setattr(obj, slot, fields[slot])
+	return obj
+
+class Seat():
+	__slots__ = ("username", "chips")
+
+	def __init__(self, username, chips):
+		self.username = username
+		self.chips = chips
+
+class Turn():
+	__slots__ = ("timer", "deadline", "action_player", "bet_size")
+
+	def __init__(self, timer):
+		self.timer = timer
+		self.deadline = 0
+		self.action_player = 0
+		self.bet_size = 0
+
+class Round():
+	__slots__ = ("street", "chips_out", "last_action", "last_bet_player", "over")
+
+	def __init__(self, street = ""):
+		self.street = street
+		self.chips_out = [0] * SEATS
+		self.last_action = [""] * SEATS
+		self.last_bet_player = 0
+		self.over = 0
+
+class Hand():
+	"""starting_positions is the dealing order, small blind first and button
+	last, except heads up where the button is the small blind. Who is still
+	in and who can still bet are kept as seat bitmasks."""
+	__slots__ = ("starting_positions", "dealt", "folded", "all_in", "hole_cards", "pot", "contributed", "community_cards", "hands", "equity")
+
+	def __init__(self, positions = ()):
+		self.starting_positions = list(positions)
+		self.dealt = to_mask(positions)
+		self.folded = 0
+		self.all_in = 0
+		self.hole_cards = [None] * SEATS
+		self.pot = 0
+		self.contributed = [0] * SEATS
+		self.community_cards = []
+		self.hands = [0] * SEATS
+		self.equity = [None] * SEATS
+
+	@property
+	def live(self):
+		return self.dealt & ~self.folded
+
+	@property
+	def able(self):
+		# still in and with chips behind
+		return self.dealt & ~self.folded & ~self.all_in
+
+	@property
+	def positions(self):
+		return [seat for seat in self.starting_positions if not self.folded >> seat & 1]
+
+class Table():
+	"""Table state with every per-player field held in a SEATS-long array, so
+	positions are seat numbers. to_wire renders the nested dict clients expect."""
+	__slots__ = ("seats", "button", "big_blind", "hand", "round", "turn")
+
+	def __init__(self, big_blind, turn_time):
+		self.seats = [None] * SEATS
+		self.button = SEATS - 1
+		self.big_blind = big_blind
+		self.hand = Hand()
+		self.round = Round()
+		self.turn = Turn(turn_time)
+
+	def seat_of(self, username):
+		for i, seat in enumerate(self.seats):
+			if seat and seat.username == username:
+				return i
+		return None
+
+	def name(self, seat):
+		return self.seats[seat].username if self.seats[seat] else ""
+
+	def occupied(self):
+		return [i for i, seat in enumerate(self.seats) if seat]
+
+	def runout(self):
+		# betting is closed with at most one player able to bet: the cards go
+		# face up and the board is dealt out
+		hand = self.hand
+		return bool(self.round.over) and COUNT[hand.live] >= 2 and COUNT[hand.able] <= 1
+
+	def stacked(self):
+		# mask of the seats with chips to be dealt in
+		return to_mask(i for i, seat in enumerate(self.seats) if seat and seat.chips > 0)
+
+	def public_wire(self):
+		hand, rnd, turn = self.hand, self.round, self.turn
+		names = [seat.username if seat else "" for seat in self.seats]
+		return {
+			"table": {
+				"players_chips": {seat.username: seat.chips for seat in self.seats if seat},
+				"seats": names,
+				"big_blind": self.big_blind,
+			},
+			"hand": {
+				"positions": [names[i] for i in hand.positions],
+				"starting_positions": [names[i] for i in hand.starting_positions],
+				"hole_cards": {},
+				"pot": hand.pot,
+				"community_cards": list(hand.community_cards),
+				"hands": {},
+				"equity": {},
+			},
+			"round": {
+				"chips_out": {names[i]: rnd.chips_out[i] for i in hand.starting_positions},
+				"street": rnd.street,
+				"last_action": {names[i]: rnd.last_action[i] for i in hand.starting_positions},
+				"last_bet_player": rnd.last_bet_player,
+				"over": rnd.over,
+			},
+			"turn": {
+				"timer": turn.timer,
+				"deadline": turn.deadline,
+				"action_player": turn.action_player,
+				"bet_size": turn.bet_size,
+			},
+		}
+
+	def private_wire(self, viewer, reveal = False):
+		hand = self.hand
+		if reveal:
+			seats = hand.starting_positions
+			equity = {self.name(i): hand.equity[i] for i in hand.positions if hand.equity[i] is not None}
+		else:
+			seat = self.seat_of(viewer)
+			seats = [seat] if seat is not None and hand.hole_cards[seat] else []
+			equity = {}
+		hole_cards = {self.name(i): hand.hole_cards[i] for i in seats}
+		hands = {self.name(i): evaluator.describe(hand.hands[i]) if hand.hands[i] else "" for i in seats}
+		if not reveal and viewer is not None:
+			hole_cards.setdefault(viewer, "")
+			hands.setdefault(viewer, "")
+		return {"hole_cards": hole_cards, "hands": hands, "equity": equity}
+
+	def to_wire(self, viewer = None, reveal = False):
+		state = self.public_wire()
+		state["hand"].update(self.private_wire(viewer, reveal))
+		return state
@@ -0,0 +1,62 @@
+import os
+import asyncio
+from secrets import token_hex
+
+TABLE_IDLE_TIMEOUT = int(os.getenv("TABLE_IDLE_TIMEOUT", 600))
+
+class TableManager():
+
+	def __init__(self, loop, factory, idle_timeout = TABLE_IDLE_TIMEOUT, permanent = (), owns = None):
+		self.loop = loop
+		self.factory = factory
+		self.owns = owns or (lambda table_id: True)
+		self.idle_timeout = idle_timeout
+		self.permanent = set(permanent)
+		self.tables = {}
+		self.tasks = {}
+		for table_id in self.permanent:
+			if self.owns(table_id):
+				self.create(table_id)
+
+	def __len__(self):
+		return len(self.tables)
+
+	def __iter__(self):
+		return iter(list(self.tables.values()))
+
+	def get(self, table_id):
+		return self.tables.get(table_id)
+
+	def create(self, table_id = None, **kwargs):
+		while table_id is None or not self.owns(table_id):
+			table_id = token_hex(4)
+		if table_id in self.tables:
+			return self.tables[table_id]
+		table = self.factory(self.loop, table_id, **kwargs)
+		self.tables[table_id] = table
+		self.tasks[table_id] = self.loop.create_task(table.main())
+		return table
+
+	def destroy(self, table_id):
+		table = self.tables.pop(table_id, None)
+		task = self.tasks.pop(table_id, None)
+		if task:
+			task.cancel()
+		if table:
+			for task in list(table.background):
+				task.cancel()
+		if table and table.lobby:
+			table.lobby.remove(table_id)
+		return table
+
+	def reap_idle(self):
+		now = self.loop.time()
+		idle = [table_id for table_id, table in self.tables.items() if table_id not in self.permanent and table.is_idle(now, self.idle_timeout)]
+		for table_id in idle:
+			self.destroy(table_id)
+		return idle
+
+	async def reap(self, interval = 60):
+		while True:
+			await asyncio.sleep(interval)
+			self.reap_idle()
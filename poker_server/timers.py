@@ -0,0 +1,103 @@
+import os
+import math
+import asyncio
+
+TIMER_RESOLUTION = float(os.getenv("TIMER_RESOLUTION", 0.1))
+WHEEL_SLOTS = 64
+WHEEL_LEVELS = 3
+
+class Deadline():
+	__slots__ = ("tick", "callback", "args", "bucket")
+
+	def __init__(self, tick, callback, args):
+		self.tick = tick
+		self.callback = callback
+		self.args = args
+		self.bucket = None
+
+	def cancel(self):
+		if self.bucket is not None:
+			self.bucket.discard(self)
+			self.bucket = None
+
+	@property
+	def cancelled(self):
+		return self.bucket is None
+
+class TimerWheel():
+	"""Hierarchical timing wheel shared by every table in the process. Level n
+	slots are WHEEL_SLOTS ** n ticks wide; a deadline sits in the lowest level
+	that can hold it and cascades down as the wheel turns. Scheduling and
+	cancelling are O(1), and the loop is only woken while deadlines are pending."""
+
+	def __init__(self, loop = None, resolution = TIMER_RESOLUTION, slots = WHEEL_SLOTS, levels = WHEEL_LEVELS):
+		self.loop = loop or asyncio.get_event_loop()
+		self.resolution = resolution
+		self.slots = slots
+		self.levels = [[set() for _ in range(slots)] for _ in range(levels)]
+		self.pending = 0
+		self.tick = 0
+		self.origin = self.loop.time()
+		self.handle = None
+		self.wakeups = 0
+		self.fired = 0
+
+	def now_tick(self):
+		return int((self.loop.time() - self.origin) / self.resolution)
+
+	def _place(self, deadline):
+		# The lowest level whose current block also holds the deadline; past
+		# the top level it waits in the top wheel and is re-placed on cascade.
+		level = 0
+		while level < len(self.levels) - 1 and deadline.tick // self.slots ** (level + 1) != self.tick // self.slots ** (level + 1):
+			level += 1
+		bucket = self.levels[level][(deadline.tick // self.slots ** level) % self.slots]
+		bucket.add(deadline)
+		deadline.bucket = bucket
+
+	def schedule(self, delay, callback, *args):
+		if self.handle is None and not self.pending:
+			self.tick = self.now_tick()
+		tick = math.ceil((self.loop.time() + delay - self.origin) / self.resolution)
+		deadline = Deadline(max(tick, self.tick + 1), callback, args)
+		self._place(deadline)
+		self.pending += 1
+		self._arm()
+		return deadline
+
+	def _arm(self):
+		if self.handle is None:
+			self.handle = self.loop.call_at(self.origin + (self.tick + 1) * self.resolution, self._advance)
+
+	def _advance(self):
+		self.handle = None
+		self.wakeups += 1
+		target = self.now_tick()
+		while self.tick < target:
+			self.tick += 1
+			for level in range(len(self.levels) - 1, 0, -1):
+				span = self.slots ** level
+				if self.tick % span == 0:
+					bucket = self.levels[level][(self.tick // span) % self.slots]
+					cascade = list(bucket)
+					bucket.clear()
+					for deadline in cascade:
+						self._place(deadline)
+			bucket = self.levels[0][self.tick % self.slots]
+			due = [deadline for deadline in bucket if deadline.tick <= self.tick]
+			for deadline in due:
+				bucket.discard(deadline)
+				deadline.bucket = None
+				self.fired += 1
+				deadline.callback(*deadline.args)
+		self.pending = sum(len(bucket) for level in self.levels for bucket in level)
+		if self.pending:
+			self._arm()
+
+wheel = None
+
+def get_wheel(loop = None):
+	global wheel
+	if wheel is None:
+		wheel = TimerWheel(loop)
+	return wheel
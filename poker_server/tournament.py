@@ -0,0 +1,224 @@
+import os
+import json
+import math
+import time
+import random
+import asyncio
+import database
+import commands
+from state import SEATS
+
+TOURNAMENT_SCHEDULE = os.getenv("TOURNAMENT_SCHEDULE")
+PAID_FRACTION = 0.15
+
+# (big blind, seconds) per level; the last level holds until the end.
+LEVELS = [(100, 600), (200, 600), (300, 600), (400, 600), (600, 600), (800, 600), (1000, 600),
+	(1500, 600), (2000, 600), (3000, 600), (4000, 600), (6000, 600), (8000, 600), (10000, 600)]
+
+def payouts(entrants, pool, paid_fraction = PAID_FRACTION):
+	"""Prize per finishing place, 1st first. Weights fall off as 1/place and
+	whatever rounding leaves over goes to the winner."""
+	paid = max(1, int(entrants * paid_fraction))
+	weights = [1 / place for place in range(1, paid + 1)]
+	total = sum(weights)
+	prizes = [int(pool * weight / total) for weight in weights]
+	prizes[0] += pool - sum(prizes)
+	return prizes
+
+class Director():
+	"""Runs one tournament over Poker tables from a TableManager. Every table
+	reports in at its hand boundary; that is when its busted players are
+	eliminated, its blinds go up, and it is broken or gives up seats to the
+	shortest table. Tables are bucketed by player count, so the work at each
+	boundary does not grow with the number of tables."""
+
+	def __init__(self, loop, tournament_id, tables, buy_in, stack, levels = LEVELS, start_at = None,
+		ledger = database, seats = SEATS, seed = None):
+		self.loop = loop
+		self.tournament_id = tournament_id
+		self.tables = tables
+		self.buy_in = buy_in
+		self.stack = stack
+		self.levels = levels
+		self.start_at = start_at
+		self.ledger = ledger
+		self.seats = seats
+		self.rng = random.Random(seed)
+		self.entrants = []
+		self.counts = {}
+		# sum of counts, players seated or on their way to a seat
+		self.seated = 0
+		self.by_count = [set() for _ in range(seats + 1)]
+		self.places = {}
+		self.prizes = []
+		self.remaining = 0
+		self.started = None
+		self.finished = asyncio.Event()
+		self.moves = 0
+		self.boundaries = 0
+		self.boundary_seconds = 0.0
+
+	def __repr__(self):
+		return f"<Director {self.tournament_id} {self.remaining}/{len(self.entrants)} on {len(self.counts)} tables>"
+
+	async def register(self, username):
+		if self.started is not None:
+			return "started"
+		if username in self.entrants:
+			return "registered"
+		if self.ledger:
+			result = await self.ledger.join(username, self.buy_in, self.tournament_id)
+			if result != "success":
+				return result
+		self.entrants.append(username)
+		return "success"
+
+	def big_blind(self):
+		elapsed = self.loop.time() - self.started
+		for big_blind, seconds in self.levels:
+			if elapsed < seconds:
+				return big_blind
+			elapsed -= seconds
+		return self.levels[-1][0]
+
+	def _count(self, table_id, count):
+		old = self.counts.get(table_id)
+		if old is not None:
+			self.by_count[old].discard(table_id)
+			self.seated -= old
+		if count is None:
+			self.counts.pop(table_id, None)
+			return
+		self.counts[table_id] = count
+		self.seated += count
+		self.by_count[count].add(table_id)
+
+	def shortest(self, exclude):
+		for count, bucket in enumerate(self.by_count):
+			for table_id in bucket:
+				if table_id != exclude:
+					return table_id, count
+		return None, None
+
+	def start(self):
+		players = list(self.entrants)
+		self.rng.shuffle(players)
+		self.remaining = len(players)
+		self.prizes = payouts(len(players), self.buy_in * len(players))
+		self.started = self.loop.time()
+		if self.remaining < 2:
+			return self.loop.create_task(self.finish(None))
+		count = math.ceil(len(players) / self.seats)
+		for i in range(count):
+			table = self.tables.create(f"{self.tournament_id}.{i}", settlement = None, director = self, bots = None, lobby = None)
+			table.table.big_blind = self.big_blind()
+			seated = players[i::count]
+			for seat, username in enumerate(seated):
+				table.sit(username, seat, self.stack)
+			self._count(table.table_id, len(seated))
+			table.submit(commands.Start())
+
+	async def run(self):
+		if self.start_at:
+			await asyncio.sleep(max(0, self.start_at - time.time()))
+		self.start()
+		await self.finished.wait()
+
+	async def hand_ended(self, poker):
+		start = time.perf_counter()
+		table = poker.table
+		busted = [seat for seat in table.occupied() if table.seats[seat].chips <= 0]
+		# Busted in the same hand: whoever started it with more finishes higher.
+		busted.sort(key = lambda seat: poker.hand_start.get(table.seats[seat].username, 0))
+		for seat in busted:
+			username = table.seats[seat].username
+			table.seats[seat] = None
+			await self.eliminate(username)
+		# counts include players already sent here but not yet seated
+		count = self.counts[poker.table_id] - len(busted)
+		self._count(poker.table_id, count)
+		if self.remaining <= 1:
+			return await self.finish(poker)
+		table.big_blind = self.big_blind()
+		# a table only breaks once the others have a seat for everyone on it;
+		# until then a short table waits for the others to balance onto it
+		room = self.seats * (len(self.counts) - 1) - (self.seated - count)
+		if (len(self.counts) > math.ceil(self.remaining / self.seats) or count < 2) and room >= count:
+			await self.break_table(poker)
+		else:
+			while table.occupied():
+				target, smallest = self.shortest(poker.table_id)
+				if target is None or count - smallest < 2:
+					break
+				await self.move(poker, table.occupied()[-1], target)
+				count -= 1
+		self.boundaries += 1
+		self.boundary_seconds += time.perf_counter() - start
+
+	async def move(self, poker, seat, target_id):
+		table = poker.table
+		username, chips = table.seats[seat].username, table.seats[seat].chips
+		table.seats[seat] = None
+		self._count(poker.table_id, self.counts[poker.table_id] - 1)
+		self._count(target_id, self.counts[target_id] + 1)
+		self.tables.get(target_id).submit(commands.Arrive(username, chips))
+		self.moves += 1
+		await poker.sio.send({"table": target_id}, to=poker.room(username))
+
+	async def break_table(self, poker):
+		for seat in poker.table.occupied():
+			target, _ = self.shortest(poker.table_id)
+			await self.move(poker, seat, target)
+		# players already sent here but not yet seated go on elsewhere
+		queued = []
+		while not poker.queue.empty():
+			queued.append(poker.queue.get_nowait())
+		for command in queued:
+			if isinstance(command, commands.Arrive):
+				target, _ = self.shortest(poker.table_id)
+				self._count(target, self.counts[target] + 1)
+				self.tables.get(target).submit(command)
+			else:
+				poker.submit(command)
+		self._count(poker.table_id, None)
+		self.loop.call_soon(self.tables.destroy, poker.table_id)
+
+	async def eliminate(self, username):
+		place = self.remaining
+		self.remaining -= 1
+		self.places[username] = place
+		await self.pay(username, place)
+
+	async def pay(self, username, place):
+		prize = self.prizes[place - 1] if place <= len(self.prizes) else 0
+		if self.ledger:
+			await self.ledger.leave(username, prize, self.tournament_id)
+
+	async def finish(self, poker):
+		if poker is not None:
+			for seat in poker.table.occupied():
+				username = poker.table.seats[seat].username
+				self.places[username] = 1
+				await self.pay(username, 1)
+			self._count(poker.table_id, None)
+			self.loop.call_soon(self.tables.destroy, poker.table_id)
+		else:
+			# too few to play: a lone entrant takes first, which is the buy-in back
+			for username in self.entrants:
+				self.places[username] = 1
+				await self.pay(username, 1)
+		self.remaining = 0
+		self.finished.set()
+
+	def standings(self):
+		return sorted(self.places.items(), key = lambda item: item[1])
+
+def load(loop, tables, path = TOURNAMENT_SCHEDULE):
+	"""Directors for the tournaments in a JSON schedule: a list of objects
+	with id, buy_in, stack, start_at (epoch seconds) and optional levels."""
+	if not path:
+		return {}
+	with open(path) as f:
+		schedule = json.load(f)
+	return {entry["id"]: Director(loop, entry["id"], tables, entry["buy_in"], entry["stack"],
+		[tuple(level) for level in entry.get("levels", LEVELS)], entry.get("start_at")) for entry in schedule}
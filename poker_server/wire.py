@@ -0,0 +1,223 @@
+import struct
+import evaluator
+from state import SEATS
+from commands import CommandError
+
+# Opt-in compact encoding, picked with ?wire=binary on connect. A state message
+# is the public section, encoded once per version, followed by the viewer's
+# private section. Integers are LEB128 varints (chips zigzagged), cards are
+# evaluator indices packed six bits each and players are seat numbers.
+
+VERSION = 1
+STREETS = ["", "preflop", "flop", "turn", "river"]
+LAST_ACTIONS = ["", "smallblind", "bigblind", "check", "call", "raise", "fold"]
+# new actions go on the end; a command's byte is its index
+COMMANDS = ["join", "leave", "check", "call", "raise", "fold", "state", "create", "watch", "lobby", "register"]
+EQUITY_SCALE = 0xFFFF
+
+def write_varint(out, value):
+	while value > 0x7F:
+		out.append(value & 0x7F | 0x80)
+		value >>= 7
+	out.append(value)
+
+def read_varint(buf, offset):
+	value = shift = 0
+	while True:
+		byte = buf[offset]
+		offset += 1
+		value |= (byte & 0x7F) << shift
+		if byte < 0x80:
+			return value, offset
+		shift += 7
+
+def write_signed(out, value):
+	write_varint(out, value << 1 if value >= 0 else (-value << 1) - 1)
+
+def read_signed(buf, offset):
+	value, offset = read_varint(buf, offset)
+	return (value >> 1) ^ -(value & 1), offset
+
+def write_str(out, value):
+	data = value.encode()
+	write_varint(out, len(data))
+	out += data
+
+def read_str(buf, offset):
+	size, offset = read_varint(buf, offset)
+	if offset + size > len(buf):
+		raise IndexError("string runs past the end of the frame")
+	return bytes(buf[offset:offset + size]).decode(), offset + size
+
+def write_cards(out, cards):
+	out.append(len(cards))
+	bits = count = 0
+	for card in cards:
+		bits |= evaluator.CARD_INDEX[card] << count
+		count += 6
+		while count >= 8:
+			out.append(bits & 0xFF)
+			bits >>= 8
+			count -= 8
+	if count:
+		out.append(bits)
+
+def read_cards(buf, offset):
+	n = buf[offset]
+	offset += 1
+	size = (n * 6 + 7) // 8
+	bits = int.from_bytes(buf[offset:offset + size], "little")
+	return [evaluator.CARD_NAMES[(bits >> (6 * i)) & 0x3F] for i in range(n)], offset + size
+
+def write_seats(out, seats):
+	out.append(len(seats))
+	out += bytes(seats)
+
+def read_seats(buf, offset):
+	n = buf[offset]
+	return list(buf[offset + 1:offset + 1 + n]), offset + 1 + n
+
+def encode_public(table, seq, message = ""):
+	hand, rnd, turn = table.hand, table.round, table.turn
+	out = bytearray([VERSION])
+	write_varint(out, seq)
+	write_str(out, message)
+	mask = sum(1 << i for i in table.occupied())
+	write_varint(out, mask)
+	for seat in table.seats:
+		if seat:
+			write_str(out, seat.username)
+			write_signed(out, seat.chips)
+	write_varint(out, table.big_blind)
+	write_seats(out, hand.positions)
+	write_seats(out, hand.starting_positions)
+	write_signed(out, hand.pot)
+	write_cards(out, hand.community_cards)
+	out.append(STREETS.index(rnd.street))
+	for seat in hand.starting_positions:
+		write_signed(out, rnd.chips_out[seat])
+		out.append(LAST_ACTIONS.index(rnd.last_action[seat]))
+	write_varint(out, rnd.last_bet_player)
+	out.append(rnd.over)
+	write_varint(out, turn.timer)
+	write_varint(out, int(turn.deadline * 1000))
+	write_varint(out, turn.action_player)
+	write_signed(out, turn.bet_size)
+	return bytes(out)
+
+def encode_private(table, viewer, reveal = False):
+	hand = table.hand
+	if reveal:
+		seats = hand.starting_positions
+	else:
+		seat = table.seat_of(viewer)
+		seats = [seat] if seat is not None and hand.hole_cards[seat] else []
+	out = bytearray([len(seats)])
+	for seat in seats:
+		out.append(seat)
+		write_cards(out, hand.hole_cards[seat])
+		write_varint(out, hand.hands[seat])
+	shown = [seat for seat in hand.positions if hand.equity[seat] is not None] if reveal else []
+	out.append(len(shown))
+	for seat in shown:
+		out.append(seat)
+		out += struct.pack("<H", round(hand.equity[seat] * EQUITY_SCALE))
+	return bytes(out)
+
+def encode_state(table, viewer, seq, message = "", reveal = False):
+	return encode_public(table, seq, message) + encode_private(table, viewer, reveal)
+
+def decode_state(buf, viewer = None):
+	"""Inverse of encode_state, rendered as the dict Table.to_wire gives plus
+	"seq" and "message". Equity comes back rounded to 1/65535."""
+	assert buf[0] == VERSION, "unknown wire version"
+	seq, offset = read_varint(buf, 1)
+	message, offset = read_str(buf, offset)
+	mask, offset = read_varint(buf, offset)
+	names = [""] * SEATS
+	chips = {}
+	for i in range(SEATS):
+		if mask >> i & 1:
+			names[i], offset = read_str(buf, offset)
+			chips[names[i]], offset = read_signed(buf, offset)
+	big_blind, offset = read_varint(buf, offset)
+	positions, offset = read_seats(buf, offset)
+	starting, offset = read_seats(buf, offset)
+	pot, offset = read_signed(buf, offset)
+	community, offset = read_cards(buf, offset)
+	street = STREETS[buf[offset]]
+	offset += 1
+	chips_out, last_action = {}, {}
+	for seat in starting:
+		chips_out[names[seat]], offset = read_signed(buf, offset)
+		last_action[names[seat]] = LAST_ACTIONS[buf[offset]]
+		offset += 1
+	last_bet_player, offset = read_varint(buf, offset)
+	over = buf[offset]
+	timer, offset = read_varint(buf, offset + 1)
+	deadline, offset = read_varint(buf, offset)
+	action_player, offset = read_varint(buf, offset)
+	bet_size, offset = read_signed(buf, offset)
+	hole_cards, hands, equity = {}, {}, {}
+	count = buf[offset]
+	offset += 1
+	for _ in range(count):
+		name = names[buf[offset]]
+		hole_cards[name], offset = read_cards(buf, offset + 1)
+		rank, offset = read_varint(buf, offset)
+		hands[name] = evaluator.describe(rank) if rank else ""
+	count = buf[offset]
+	offset += 1
+	for _ in range(count):
+		equity[names[buf[offset]]] = struct.unpack_from("<H", buf, offset + 1)[0] / EQUITY_SCALE
+		offset += 3
+	if viewer is not None and not equity:
+		hole_cards.setdefault(viewer, "")
+		hands.setdefault(viewer, "")
+	return {
+		"table": {"players_chips": chips, "seats": names, "big_blind": big_blind},
+		"hand": {
+			"positions": [names[i] for i in positions],
+			"starting_positions": [names[i] for i in starting],
+			"hole_cards": hole_cards,
+			"pot": pot,
+			"community_cards": community,
+			"hands": hands,
+			"equity": equity,
+		},
+		"round": {"chips_out": chips_out, "street": street, "last_action": last_action, "last_bet_player": last_bet_player, "over": over},
+		"turn": {"timer": timer, "deadline": deadline / 1000, "action_player": action_player, "bet_size": bet_size},
+		"message": message,
+		"seq": seq,
+	}
+
+def encode_action(data):
+	out = bytearray([COMMANDS.index(data["action"])])
+	if data["action"] == "join":
+		out.append(int(data["seat"]))
+		write_varint(out, int(data["amount"]))
+	elif data["action"] == "raise":
+		write_varint(out, int(data["amount"]))
+	elif data["action"] == "watch":
+		write_str(out, data["table"])
+	elif data["action"] == "register":
+		write_str(out, data["tournament"])
+	return bytes(out)
+
+def decode_action(buf):
+	# a frame that is empty, cut short or names no action is the client's
+	# error, as commands.parse treats bad JSON
+	try:
+		data = {"action": COMMANDS[buf[0]]}
+		if data["action"] == "join":
+			data["seat"] = buf[1]
+			data["amount"] = read_varint(buf, 2)[0]
+		elif data["action"] == "raise":
+			data["amount"] = read_varint(buf, 1)[0]
+		elif data["action"] == "watch":
+			data["table"] = read_str(buf, 1)[0]
+		elif data["action"] == "register":
+			data["tournament"] = read_str(buf, 1)[0]
+	except (IndexError, TypeError, UnicodeDecodeError):
+		raise CommandError("bad action frame")
+	return data